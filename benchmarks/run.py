@@ -0,0 +1,344 @@
+"""
+Offline benchmarks for the monitoring hot paths.
+
+Everything runs against the local fixture server, so results don't depend on
+live retailer sites:
+
+    python benchmarks/run.py                          # run and print a report
+    python benchmarks/run.py --save-baseline          # store results as the baseline
+    python benchmarks/run.py --compare                # fail if slower than the baseline
+
+Each benchmark reports throughput and p50/p95 latency. With --compare, a
+benchmark whose p50 is more than --tolerance slower than the stored baseline
+counts as a regression and the script exits with status 1.
+"""
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(ROOT, 'benchmarks')
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+for path in (os.path.join(ROOT, 'shared'), os.path.join(ROOT, 'projects', 'price-tracker'),
+             os.path.join(ROOT, 'projects', 'website-monitor'), BENCHMARK_DIR):
+    sys.path.append(path)
+
+from server import FixtureServer
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(func: Callable[[], int], repeat: int, warmup: int = 1,
+            setup: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """
+    Time func repeat times. func returns the number of items it processed,
+    which turns the total time into a throughput. setup runs untimed before each call.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+    samples = []
+    items = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        items += func()
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    return {
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'mean_ms': statistics.mean(samples) * 1000,
+        'throughput_per_s': items / total if total else 0.0,
+        'runs': repeat,
+    }
+
+
+# Price tracker
+
+def write_watchlist(path: str, base_url: str, rows: int) -> None:
+    """A watchlist spread evenly over the three retailers, all pointing at the local server."""
+    rvrc_selector = ('div.pdp-summary:nth-child(2) > div:nth-child(1) > div:nth-child(2) > '
+                     'span:nth-child(1) > span:nth-child(1)')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(['url', 'selector', 'price', 'company'])
+        for i in range(rows):
+            kind = i % 3
+            if kind == 0:
+                writer.writerow([f'{base_url}/rvrc/{i}', rvrc_selector, '1299', 'rvrc'])
+            elif kind == 1:
+                writer.writerow([f'{base_url}/power/p-{3000000 + i}/', 'pwr-price', '6090', 'power'])
+            else:
+                writer.writerow([f'{base_url}/obs/{i}', '.jh', '1299', 'obs'])
+
+
+def bench_track_prices(server: FixtureServer, rows: int, repeat: int) -> Dict[str, float]:
+    import reader
+    import requestcompany
+
+    requestcompany.POWER_API_URL = f'{server.base_url}/api/v2/products'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        watchlist = os.path.join(tmp, 'watchlist.csv')
+        write_watchlist(watchlist, server.base_url, rows)
+        webhook = f'{server.base_url}/webhook'
+
+        def run() -> int:
+            # Fresh history each run so every run does the same work
+            history = os.path.join(tmp, f'history-{time.perf_counter_ns()}.sqlite3')
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    reader.track_prices(watchlist, webhook, history_path=history)
+                finally:
+                    sys.stdout = stdout
+            return rows
+
+        return measure(run, repeat)
+
+
+def bench_alert_rules(rows: int, repeat: int) -> Dict[str, float]:
+    """Every alert rule over one batch of synthetic checks (column building included)."""
+    import random
+
+    import alerts
+    from watchlist import WatchlistRow
+
+    rng = random.Random(rows)
+    checks = []
+    lows = {}
+    for i in range(rows):
+        url = f'https://example.no/p/{i}'
+        old_price = float(rng.randint(500, 2000))
+        row = WatchlistRow(url, '', str(old_price), 'obs', None, target_price=900.0 if i % 10 == 0 else None)
+        checks.append(alerts.Check(row, old_price - rng.randint(-50, 50), old_price, True, bool(i % 7)))
+        lows[url] = old_price - 20
+
+    def run() -> int:
+        columns = alerts.Columns(checks, lows)
+        alerts.evaluate(columns)
+        return rows
+
+    return measure(run, repeat)
+
+
+# Website monitor
+
+def make_monitor(tmp: str):
+    from monitor import WebsiteMonitor
+
+    with open(os.path.join(tmp, 'config.json'), 'w') as f:
+        json.dump({'websites': [], 'discord_webhook': ''}, f)
+    return WebsiteMonitor(base_dir=tmp)
+
+
+def bench_get_page_content(server: FixtureServer, rows: int, scripts: int, repeat: int) -> Dict[str, float]:
+    selectors = {
+        'main_content': 'body',
+        'schedule_table': 'table.schedule, .schedule',
+        'announcements': '.announcements, .news, .updates',
+    }
+    url = f'{server.base_url}/schedule?rows={rows}&scripts={scripts}'
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = make_monitor(tmp)
+
+        def run() -> int:
+            if not monitor.get_page_content(url, selectors):
+                raise RuntimeError("get_page_content returned no content")
+            return 1
+
+        return measure(run, repeat)
+
+
+def bench_capture_page(server: FixtureServer, rows: int, repeat: int) -> Optional[Dict[str, float]]:
+    """One page load for both the screenshot and the rendered content, as a website check does it."""
+    url = f'{server.base_url}/schedule?rows={rows}&scripts=5'
+    selectors = {'main_content': 'body', 'schedule_table': 'table.schedule, .schedule'}
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = make_monitor(tmp)
+        try:
+            # Launch Chromium outside the timed runs
+            monitor.browser_pool.start()
+        except Exception as e:
+            print(f"Skipping capture_page: Chromium unavailable ({e.__class__.__name__})")
+            return None
+        try:
+            def run() -> int:
+                screenshots, _ = monitor.capture_page(url, selectors)
+                if screenshots is None:
+                    raise RuntimeError("capture_page failed")
+                return 1
+
+            return measure(run, repeat)
+        finally:
+            monitor.browser_pool.close()
+
+
+def write_synthetic_pair(tmp: str, height: int, change_ratio: float, width: int = 1280):
+    """Two page-like PNGs; change_ratio of the rows differ in the second one."""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(height)
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    # Text-like noise lines every 24px
+    for y in range(20, height - 12, 24):
+        img[y:y + 10, 40:width - 40] = rng.integers(0, 255, (10, width - 80, 3), dtype=np.uint8)
+    changed = img.copy()
+    changed_rows = int(height * change_ratio)
+    if changed_rows:
+        start = (height - changed_rows) // 2
+        changed[start:start + changed_rows] = 255 - changed[start:start + changed_rows]
+
+    before = os.path.join(tmp, f'before_{height}_{change_ratio}.png')
+    after = os.path.join(tmp, f'after_{height}_{change_ratio}.png')
+    cv2.imwrite(before, img)
+    cv2.imwrite(after, changed)
+    return before, after
+
+
+def bench_visual_check(height: int, change_ratio: float, repeat: int) -> Dict[str, float]:
+    """check_visual of a changed screenshot against a stored baseline: digest, diff pool, baseline write."""
+    from baselines import content_digest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = make_monitor(tmp)
+        before, after = write_synthetic_pair(tmp, height, change_ratio)
+        with open(before, 'rb') as f:
+            before_png = f.read()
+        with open(after, 'rb') as f:
+            after_png = f.read()
+        after_blob = monitor.baselines.blob_path(content_digest(after_png))
+        diff = os.path.join(tmp, 'diff.png')
+
+        def setup() -> None:
+            # Every run starts from the before image as the baseline, with the after blob not stored yet
+            monitor.baselines.update('bench', before_png)
+            if after_png != before_png and os.path.exists(after_blob):
+                os.remove(after_blob)
+
+        def run() -> int:
+            monitor.check_visual('bench', after_png, diff)
+            return 1
+
+        try:
+            return measure(run, repeat, setup=setup)
+        finally:
+            monitor.diff_pool.close()
+
+
+# Reporting
+
+def run_all(args) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    with FixtureServer() as server:
+        for rows in args.watchlist_rows:
+            print(f"track_prices rows={rows}")
+            results[f'track_prices[rows={rows}]'] = bench_track_prices(server, rows, args.repeat)
+
+        for rows in args.alert_rows:
+            print(f"alert_rules rows={rows}")
+            results[f'alert_rules[rows={rows}]'] = bench_alert_rules(rows, args.repeat)
+
+        for rows in args.schedule_rows:
+            print(f"get_page_content rows={rows}")
+            results[f'get_page_content[rows={rows}]'] = bench_get_page_content(server, rows, 20, args.repeat)
+
+        if not args.skip_browser:
+            print("capture_page")
+            result = bench_capture_page(server, args.schedule_rows[0], args.repeat)
+            if result:
+                results['capture_page'] = result
+
+    for height in args.image_heights:
+        for ratio in args.change_ratios:
+            print(f"visual_check height={height} change={ratio}")
+            results[f'visual_check[h={height},change={ratio}]'] = \
+                bench_visual_check(height, ratio, args.repeat)
+    return results
+
+
+def print_report(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]]) -> None:
+    print()
+    print(f"{'benchmark':48} {'p50 ms':>10} {'p95 ms':>10} {'items/s':>10} {'vs base':>9}")
+    for name, result in results.items():
+        change = ''
+        if baseline and name in baseline and baseline[name]['p50_ms']:
+            change = f"{(result['p50_ms'] / baseline[name]['p50_ms'] - 1) * 100:+.0f}%"
+        print(f"{name:48} {result['p50_ms']:10.1f} {result['p95_ms']:10.1f} "
+              f"{result['throughput_per_s']:10.1f} {change:>9}")
+
+
+def find_regressions(results, baseline, tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        limit = baseline[name]['p50_ms'] * (1 + tolerance)
+        if result['p50_ms'] > limit:
+            regressions.append(f"{name}: p50 {result['p50_ms']:.1f} ms > {limit:.1f} ms")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the monitoring hot paths.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--watchlist-rows', type=int, nargs='+', default=[30, 300])
+    parser.add_argument('--alert-rows', type=int, nargs='+', default=[100000])
+    parser.add_argument('--schedule-rows', type=int, nargs='+', default=[200, 2000])
+    parser.add_argument('--image-heights', type=int, nargs='+', default=[2000, 8000, 20000])
+    parser.add_argument('--change-ratios', type=float, nargs='+', default=[0.0, 0.01, 0.2])
+    parser.add_argument('--skip-browser', action='store_true', help="Don't benchmark capture_page")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true', help="Exit 1 on regressions against the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p50 slowdown before failing")
+    parser.add_argument('--output', help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run_all(args)
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.compare:
+        if baseline is None:
+            print(f"No baseline at {args.baseline}; run with --save-baseline first")
+            sys.exit(1)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Local stand-in retailer server for offline benchmarks.
+
+Serves the recorded fixtures in benchmarks/fixtures:
+
+    /api/v2/products?ids=1,2,3     Power-style product JSON
+    /obs/<id>                      OBS product page with window.CURRENT_PAGE
+    /rvrc/<id>                     RVRC product page for the CSS selector path
+    /schedule?rows=N&scripts=M     schedule page of configurable size and JavaScript
+    /webhook                       Discord webhook stand-in (204)
+"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Prices are lowered by this much so every tracked product produces an alert
+PRICE_DROP = 100
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def filler(paragraphs: int) -> str:
+    """Navigation and description text to bring product pages up to realistic size."""
+    return ''.join(
+        f'<p class="filler-{i}">Lorem ipsum dolor sit amet, consectetur adipiscing elit {i}.</p>'
+        for i in range(paragraphs)
+    )
+
+
+def schedule_page(rows: int, scripts: int) -> str:
+    table_rows = ''.join(
+        f'<tr><td>{["Mandag", "Tirsdag", "Onsdag", "Torsdag", "Fredag"][i % 5]}</td>'
+        f'<td>{16 + i % 5}:00</td><td>Trening gruppe {i}</td></tr>'
+        for i in range(rows)
+    )
+    script_tags = ''.join(
+        f'<script>window.widget{i} = {{"id": {i}}}; document.addEventListener("DOMContentLoaded", '
+        f'function() {{ var el = document.createElement("div"); el.className = "timestamp"; '
+        f'el.textContent = Date.now(); document.body.appendChild(el); }});</script>'
+        for i in range(scripts)
+    )
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Hallen vår</title>'
+        '<style>table.schedule td { padding: 4px; }</style></head><body>'
+        '<header class="site-header"><div class="cookie-banner">Vi bruker cookies</div></header>'
+        '<div class="news"><p>Hallen er stengt i høstferien.</p></div>'
+        f'<table class="schedule">{table_rows}</table>'
+        f'<footer><span id="session-id">abc123</span></footer>{script_tags}</body></html>'
+    )
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'FixtureServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'', content_type: str = 'text/html; charset=utf-8') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        path = parts.path.rstrip('/')
+
+        if path == '/api/v2/products':
+            ids = [i for i in query.get('ids', [''])[0].split(',') if i]
+            template = json.loads(self.server.power_template)
+            products = []
+            for product_id in ids:
+                product = dict(template)
+                product['productId'] = int(product_id)
+                product['price'] = template['price'] - PRICE_DROP
+                products.append(product)
+            self._send(200, json.dumps(products).encode('utf-8'), 'application/json')
+        elif path.startswith('/obs/'):
+            self._send(200, self.server.obs_page)
+        elif path.startswith('/rvrc/'):
+            self._send(200, self.server.rvrc_page)
+        elif path == '/schedule':
+            rows = int(query.get('rows', ['200'])[0])
+            scripts = int(query.get('scripts', ['5'])[0])
+            self._send(200, schedule_page(rows, scripts).encode('utf-8'))
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if urlsplit(self.path).path == '/webhook':
+            self.server.webhook_posts += 1
+            self._send(204)
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, page_paragraphs: int = 400):
+        super().__init__((host, port), FixtureHandler)
+        self.power_template = load_fixture('power_product.json')
+        nav = filler(page_paragraphs)
+        self.obs_page = load_fixture('obs_product.html').replace('{{NAV}}', nav).encode('utf-8')
+        self.rvrc_page = (load_fixture('rvrc_product.html')
+                          .replace('{{NAV}}', nav).replace('{{DESCRIPTION}}', nav).encode('utf-8'))
+        self.webhook_posts = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FixtureServer':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> 'FixtureServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == '__main__':
+    with FixtureServer(port=8765) as server:
+        print(f"Serving fixtures at {server.base_url} (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,285 @@
+"""
+Monitoring daemon - runs the price tracker and the website monitor in one
+long-lived process.
+
+The watchlist and config.json are loaded once and hot-reloaded when they
+change on disk. The HTTP session and the Chromium instance stay warm between
+checks, and every product and website is checked on its own interval from a
+priority queue instead of all at once.
+
+Products that come due within a short batch window are checked together, so
+each pass still gets the fetch engine's concurrency and the retailers' batched
+lookups. Websites are checked in the background and never hold up a product pass.
+"""
+
+import argparse
+import contextvars
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PRICE_TRACKER_DIR = os.path.join(ROOT, 'projects', 'price-tracker')
+WEBSITE_MONITOR_DIR = os.path.join(ROOT, 'projects', 'website-monitor')
+
+for path in (os.path.join(ROOT, 'shared'), PRICE_TRACKER_DIR, WEBSITE_MONITOR_DIR):
+    sys.path.append(path)
+
+import reader
+from monitor import WebsiteMonitor
+from metrics import RunMetrics
+from notifications import flush_notifications
+from polling import AdaptivePolicy, PollState
+from scheduler import Scheduler
+
+# Matches the old cron cadence: prices every 4 hours, websites twice a day
+DEFAULT_PRODUCT_INTERVAL_MINUTES = 240
+DEFAULT_WEBSITE_INTERVAL_MINUTES = 720
+
+# How often the config files are checked for changes
+RELOAD_POLL_SECONDS = 5
+
+# Targets due within this many seconds of the earliest one are checked in the same pass
+DEFAULT_BATCH_WINDOW_SECONDS = 60
+
+
+def file_mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class MonitoringDaemon:
+    def __init__(self, watchlist_path: str, website_dir: str, webhook: Optional[str],
+                 product_interval: float = DEFAULT_PRODUCT_INTERVAL_MINUTES,
+                 jitter: float = 0.1, product_policy: Optional[AdaptivePolicy] = None,
+                 batch_window: float = DEFAULT_BATCH_WINDOW_SECONDS):
+        """
+        watchlist_path: price tracker CSV; rows may carry an interval_minutes column.
+        website_dir: website monitor directory with config.json, screenshots/ and data/.
+        product_interval: default minutes between checks of one product.
+        product_policy: adaptive polling bounds for products; None checks them on fixed intervals.
+        batch_window: seconds; targets due this soon are checked early, with the ones due now.
+        """
+        self.watchlist_path = os.path.abspath(watchlist_path)
+        self.history_path = reader.default_history_path(self.watchlist_path)
+        self.webhook = webhook
+        self.product_interval = product_interval
+        self.scheduler = Scheduler(jitter=jitter)
+        self.batch_window = max(0.0, batch_window)
+        # The website pass reschedules its sites from its own thread
+        self._schedule_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        # Website passes run one after another here, beside the product passes
+        self._website_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='websites')
+
+        self.monitor = WebsiteMonitor(base_dir=website_dir)
+        self.product_poll: Optional[PollState] = None
+        if product_policy is not None:
+            self.product_poll = PollState(reader.default_poll_state_path(self.watchlist_path), product_policy)
+        self.products: Dict[str, Any] = {}
+        self.websites: Dict[str, Dict[str, Any]] = {}
+        self._mtimes: Dict[str, Optional[float]] = {}
+        # Configured interval of each target in seconds, the starting point of adaptive polling
+        self._bases: Dict[str, Dict[str, float]] = {}
+
+    # Loading and hot reload
+
+    def load_products(self) -> None:
+        try:
+            rows = reader.load_watchlist(self.watchlist_path)
+        except Exception as e:
+            print(f"Error loading watchlist: {e}")
+            return
+        self.products = {row.url: row for row in rows}
+        with self._schedule_lock:
+            self._sync('product', self.products, lambda row: row.interval_minutes, self.product_interval,
+                       self.product_poll)
+        print(f"Loaded {len(self.products)} products")
+
+    def load_websites(self) -> None:
+        self.monitor.config = self.monitor.load_config(self.monitor.config_file)
+        self.websites = {site['name']: site for site in self.monitor.config.get('websites', [])}
+        self.monitor.retain_baselines(list(self.websites.values()))
+        default_interval = self.monitor.config.get('check_interval_minutes', DEFAULT_WEBSITE_INTERVAL_MINUTES)
+        with self._schedule_lock:
+            self._sync('website', self.websites, lambda site: site.get('interval_minutes'), default_interval,
+                       self.monitor.poll_state)
+        print(f"Loaded {len(self.websites)} websites")
+
+    def _sync(self, kind: str, targets: Dict[str, Any], interval_of, default_interval: float,
+              poll_state: Optional[PollState] = None) -> None:
+        """
+        Add new targets, drop removed ones and update intervals; due times of existing targets are kept.
+        With a poll state, intervals are the adapted ones and new targets start when they were due
+        in the previous process.
+        """
+        for key in [key for key in self.scheduler.keys() if key[0] == kind and key[1] not in targets]:
+            self.scheduler.remove(key)
+        self._bases[kind] = {}
+        for name, target in targets.items():
+            base = self._bases[kind][name] = self._interval_seconds(interval_of(target), default_interval)
+            interval = poll_state.interval(name, base) if poll_state is not None else base
+            key = (kind, name)
+            if key in self.scheduler:
+                self.scheduler.set_interval(key, interval)
+            else:
+                due = poll_state.next_due(name) if poll_state is not None else None
+                self.scheduler.add(key, interval, due=due)
+
+    def _poll_state(self, kind: str) -> Optional[PollState]:
+        return self.product_poll if kind == 'product' else self.monitor.poll_state
+
+    @staticmethod
+    def _interval_seconds(value: Any, default_minutes: float) -> float:
+        try:
+            minutes = float(value)
+            if minutes != minutes or minutes <= 0:  # NaN or non-positive
+                raise ValueError
+        except (TypeError, ValueError):
+            minutes = default_minutes
+        return minutes * 60
+
+    def reload_if_changed(self) -> None:
+        for path, load in ((self.watchlist_path, self.load_products),
+                           (self.monitor.config_file, self.load_websites)):
+            mtime = file_mtime(path)
+            if path in self._mtimes and mtime != self._mtimes[path]:
+                print(f"{os.path.basename(path)} changed, reloading")
+                load()
+            self._mtimes[path] = mtime
+
+    # Running checks
+
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[str, str]]:
+        """
+        Once a target is due, it and every target due within the batch window after it.
+        Nothing is taken early while nothing is due, so passes are at least a window apart.
+        """
+        now = time.time() if now is None else now
+        with self._schedule_lock:
+            next_due = self.scheduler.next_due()
+            if next_due is None or next_due > now:
+                return []
+            return self.scheduler.pop_due(now + self.batch_window)
+
+    def run_due(self, due: List[Tuple[str, str]]) -> None:
+        """
+        Hand the due websites to the background website pass and check the due
+        products as one batch in this thread.
+        """
+        websites = [self.websites[name] for kind, name in due if kind == 'website' and name in self.websites]
+        if websites:
+            self._website_runner.submit(self._check_websites, websites)
+
+        product_names = [name for kind, name in due if kind == 'product' and name in self.products]
+        if product_names:
+            # One metrics run per product pass
+            with RunMetrics('daemon_products'):
+                try:
+                    reader.check_products([self.products[name] for name in product_names], self.webhook,
+                                          self.history_path, poll_state=self.product_poll)
+                except Exception as e:
+                    print(f"Error checking products: {e}")
+            self._reschedule('product', product_names)
+
+    def _check_websites(self, websites: List[Dict[str, Any]]) -> None:
+        # Its own metrics run, bound to this thread and the check threads, as it overlaps product passes
+        with RunMetrics('daemon_websites').bind():
+            with ThreadPoolExecutor(max_workers=self.monitor.check_threads) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, self._monitor_website, site)
+                           for site in websites]
+                for site, future in zip(websites, futures):
+                    error = future.result()
+                    if error:
+                        print(f"Error monitoring {site.get('name', 'unknown')}: {error}")
+        self._reschedule('website', [site['name'] for site in websites])
+
+    def _reschedule(self, kind: str, names: List[str]) -> None:
+        now = time.time()
+        poll_state = self._poll_state(kind)
+        with self._schedule_lock:
+            for name in names:
+                # The check just fed its outcome to the poll state; follow the adapted interval
+                interval = poll_state.interval(name, self._bases.get(kind, {}).get(name)) if poll_state else None
+                self.scheduler.reschedule((kind, name), now, interval=interval)
+
+    def _monitor_website(self, website: Dict[str, Any]) -> Optional[Exception]:
+        try:
+            self.monitor.monitor_website(website)
+            return None
+        except Exception as e:
+            return e
+
+    def stop(self, *_args) -> None:
+        print("Shutting down after the current checks finish...")
+        self.stop_event.set()
+
+    def run(self) -> None:
+        print(f"Starting monitoring daemon at {datetime.now()}")
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.load_products()
+        self.load_websites()
+        self.reload_if_changed()
+
+        try:
+            while not self.stop_event.is_set():
+                self.reload_if_changed()
+                due = self.pop_due()
+                if due:
+                    self.run_due(due)
+                    continue
+
+                with self._schedule_lock:
+                    next_due = self.scheduler.next_due()
+                wait = RELOAD_POLL_SECONDS if next_due is None else min(RELOAD_POLL_SECONDS, next_due - time.time())
+                self.stop_event.wait(max(0.0, wait))
+        finally:
+            self._website_runner.shutdown(wait=True)
+            self.monitor.browser_pool.close()
+            self.monitor.diff_pool.close()
+            flush_notifications()
+            print("Monitoring daemon stopped")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the price tracker and website monitor as one daemon.")
+    parser.add_argument('--watchlist', default=os.path.join(PRICE_TRACKER_DIR, 'data', 'rvrc-data.csv'))
+    parser.add_argument('--website-dir', default=WEBSITE_MONITOR_DIR)
+    parser.add_argument('--product-interval', type=float, default=DEFAULT_PRODUCT_INTERVAL_MINUTES,
+                        help="Default minutes between checks of one product")
+    parser.add_argument('--jitter', type=float, default=0.1,
+                        help="Random fraction of each interval added or subtracted")
+    parser.add_argument('--batch-window', type=float, default=DEFAULT_BATCH_WINDOW_SECONDS,
+                        help="Seconds; targets due this soon are checked together with the ones due now")
+    parser.add_argument('--min-product-interval', type=float, default=60,
+                        help="Minutes between checks of a product whose price just changed")
+    parser.add_argument('--max-product-interval', type=float, default=7 * 24 * 60,
+                        help="Longest a stable product goes between checks, in minutes")
+    parser.add_argument('--fixed-interval', action='store_true',
+                        help="Check products on their configured interval instead of adapting it")
+    args = parser.parse_args()
+
+    webhook_url = os.getenv('DISCORD_WEBHOOK')
+    if not webhook_url:
+        print("Environment variable DISCORD_WEBHOOK is not set.")
+        sys.exit(1)
+
+    product_policy = None
+    if not args.fixed_interval:
+        product_policy = AdaptivePolicy(args.min_product_interval * 60, args.max_product_interval * 60)
+
+    MonitoringDaemon(args.watchlist, args.website_dir, webhook_url, product_interval=args.product_interval,
+                     jitter=args.jitter, product_policy=product_policy, batch_window=args.batch_window).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Vectorized price alert rules.
+
+A batch of checks is turned into NumPy columns once: new and previous price,
+stock, the row's thresholds and the all-time low from the history. Every rule
+is a function of those columns that returns a boolean mask, so each rule is a
+few array operations over the whole batch and no rule loops over the rows.
+Only the rows that alert are visited, to format their messages.
+
+Adding a rule is one registered function:
+
+    @rule('big_drop', "The price fell by {drop} kr")
+    def big_drop(c):
+        return c.in_stock & (c.old_price - c.price >= 1000)
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+# One checked product: prices in kroner (None when unknown), stocks as bools (None when unknown)
+Check = namedtuple('Check', ['row', 'price', 'old_price', 'in_stock', 'old_in_stock'])
+
+Alert = namedtuple('Alert', ['url', 'rules', 'message', 'key'])
+
+Rule = namedtuple('Rule', ['name', 'mask', 'template'])
+
+_rules = {}
+
+
+def rule(name, template):
+    """
+    Register mask(columns) -> bool array as an alert rule.
+    template is formatted with the row's values (see Columns.values) when the rule fires.
+    """
+    def decorator(mask):
+        _rules[name] = Rule(name, mask, template)
+        return mask
+    return decorator
+
+
+class Columns:
+    """The columns of a batch of checks that rules are evaluated on. Unknown numbers are NaN."""
+
+    def __init__(self, checks, all_time_lows):
+        self.urls = [check.row.url for check in checks]
+        self.companies = [check.row.company for check in checks]
+        # One pass over the checks; None becomes NaN. Stocks are 1/0 (NaN when unknown)
+        # and all_time_low is the lowest price recorded before this batch
+        table = np.array([
+            (check.price, check.old_price, check.in_stock, check.old_in_stock, check.row.target_price,
+             check.row.min_drop, check.row.min_drop_percent, all_time_lows.get(check.row.url))
+            for check in checks
+        ], dtype=float).reshape(len(checks), 8)
+        (self.price, self.old_price, in_stock, self.old_in_stock, self.target_price,
+         min_drop, min_drop_percent, self.all_time_low) = table.T
+        self.in_stock = in_stock == 1
+        self.min_drop = np.nan_to_num(min_drop, nan=0.0)
+        self.min_drop_percent = np.nan_to_num(min_drop_percent, nan=0.0)
+        self.drop = self.old_price - self.price
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.drop_percent = np.where(self.old_price > 0, self.drop / self.old_price * 100, np.nan)
+
+    def __len__(self):
+        return len(self.urls)
+
+    def values(self, index):
+        """One row's values for a message template."""
+        return {
+            'url': self.urls[index],
+            'company': self.companies[index],
+            'price': format_price(self.price[index]),
+            'old_price': format_price(self.old_price[index]),
+            'drop': format_price(self.drop[index]),
+            'drop_percent': format_price(self.drop_percent[index]),
+            'target_price': format_price(self.target_price[index]),
+            'all_time_low': format_price(self.all_time_low[index]),
+        }
+
+
+def format_price(value):
+    """1099.0 -> '1099', 1099.5 -> '1099.50'; '?' when unknown."""
+    if value is None or math.isnan(value):
+        return '?'
+    return f"{value:.0f}" if float(value).is_integer() else f"{value:.2f}"
+
+
+# Rules
+
+@rule('price_drop', "The price has gone down! It was {old_price} kr, now it's {price} kr. "
+                    "It has decreased by {drop} kr ({drop_percent}%) for {company} page.")
+def price_drop(c):
+    # Any drop by default; rows can require a minimum in kroner and/or percent
+    return c.in_stock & (c.drop > 0) & (c.drop >= c.min_drop) & (c.drop_percent >= c.min_drop_percent)
+
+
+@rule('target_price', "The {company} price of {price} kr is at or below your target of {target_price} kr.")
+def target_price(c):
+    # Only when the price crosses the target, not on every check below it
+    return c.in_stock & (c.price <= c.target_price) & ~(c.old_price <= c.target_price)
+
+
+@rule('all_time_low', "{price} kr is the lowest price seen for this product (previous low {all_time_low} kr).")
+def all_time_low(c):
+    return c.in_stock & (c.price < c.all_time_low)
+
+
+@rule('back_in_stock', "The {company} product is back in stock at {price} kr.")
+def back_in_stock(c):
+    return c.in_stock & (c.old_in_stock == 0)
+
+
+def evaluate(columns, rules=None):
+    """
+    Run rules (default: all registered) over a batch.
+    Returns {rule name: bool mask}.
+    """
+    rules = _rules.values() if rules is None else [_rules[name] for name in rules]
+    return {r.name: np.asarray(r.mask(columns), dtype=bool) for r in rules}
+
+
+def alerts(checks, all_time_lows, rules=None):
+    """
+    Alerts for a batch of Checks, one per product with every rule it triggered.
+    all_time_lows: {url: lowest recorded price} from before this batch.
+    """
+    if not checks:
+        return []
+    columns = Columns(checks, all_time_lows)
+    masks = evaluate(columns, rules)
+    names = list(masks)
+    fired = np.column_stack([masks[name] for name in names])
+
+    result = []
+    for index in np.flatnonzero(fired.any(axis=1)):
+        triggered = [name for name, hit in zip(names, fired[index]) if hit]
+        values = columns.values(index)
+        lines = [_rules[name].template.format(**values) for name in triggered]
+        message = '\n'.join(lines) + f"\nLink: {values['url']}"
+        key = f"price:{values['url']}:{values['old_price']}:{values['price']}:{'+'.join(triggered)}"
+        result.append(Alert(values['url'], triggered, message, key))
+    return result
@@ -0,0 +1,201 @@
+"""
+Parse-once field extraction for product pages.
+
+Structured data comes first: embedded JSON state (window.CURRENT_PAGE and
+the like) and JSON-LD offers are found by scanning the raw bytes for their
+marker and decoding only that JSON value, so no DOM is built. Pages without
+either are parsed once, with lxml when it is installed (falling back to
+BeautifulSoup), and every requested field is read from that single parse.
+Compiled CSS selectors are cached across rows.
+"""
+import json
+import re
+from functools import lru_cache
+from urllib.parse import parse_qsl, urljoin, urlsplit
+
+try:
+    from lxml import etree, html as lxml_html
+    from lxml.cssselect import CSSSelector
+    HAVE_LXML = True
+except ImportError:
+    from bs4 import BeautifulSoup
+    HAVE_LXML = False
+
+
+@lru_cache(maxsize=512)
+def compile_selector(selector):
+    """Compile a CSS selector once; the same selector is shared by many rows."""
+    return CSSSelector(selector, translator='html')
+
+
+def parse(html_content):
+    """Parse a document once with the fastest available parser."""
+    if HAVE_LXML:
+        try:
+            return lxml_html.document_fromstring(html_content)
+        except etree.ParserError:
+            # Raised for documents with no elements at all
+            return None
+    return BeautifulSoup(html_content, 'html.parser')
+
+
+def select_one(document, selector):
+    if HAVE_LXML:
+        matches = compile_selector(selector)(document)
+        return matches[0] if matches else None
+    return document.select_one(selector)
+
+
+def element_text(element):
+    if HAVE_LXML:
+        return element.text_content()
+    return element.get_text()
+
+
+def extract_fields(html_content, selector):
+    """
+    Read every field the tracker needs from one parse of the page.
+    Returns {'price': text or None, 'in_stock': bool}.
+    """
+    document = parse(html_content) if html_content else None
+    element = select_one(document, selector) if document is not None else None
+    if element is None:
+        return {'price': None, 'in_stock': False}
+    return {
+        'price': element_text(element),
+        'in_stock': element.get('data-cy-instock') == 'true',
+    }
+
+
+# Most bytes decoded after a marker when looking for the JSON value it introduces
+MAX_JSON_BYTES = 2 * 1024 * 1024
+
+# JSON-LD blocks looked at per page
+MAX_JSON_LD_BLOCKS = 8
+
+_decoder = json.JSONDecoder()
+
+
+def _as_bytes(html_content):
+    return html_content.encode('utf-8') if isinstance(html_content, str) else html_content
+
+
+def _decode_at(html_content, start):
+    """Decode the JSON value starting at byte offset start (leading whitespace allowed), or None."""
+    text = html_content[start:start + MAX_JSON_BYTES].decode('utf-8', errors='replace').lstrip()
+    try:
+        value, _ = _decoder.raw_decode(text)
+    except ValueError:
+        return None
+    return value
+
+
+def embedded_json(html_content, marker):
+    """
+    The JSON value assigned after a marker such as 'window.CURRENT_PAGE', or None.
+    Only the bytes of that value are decoded; the rest of the page is never parsed.
+    """
+    html_content = _as_bytes(html_content)
+    if not html_content:
+        return None
+    marker = marker.encode('utf-8')
+    position = html_content.find(marker)
+    while position >= 0:
+        end = position + len(marker)
+        # Only an assignment counts, so window.CURRENT_PAGE_META = and if (window.CURRENT_PAGE) are passed over
+        while end < len(html_content) and html_content[end:end + 1].isspace():
+            end += 1
+        if html_content[end:end + 1] == b'=' and html_content[end + 1:end + 2] not in (b'=', b'>'):
+            return _decode_at(html_content, end + 1)
+        position = html_content.find(marker, position + len(marker))
+    return None
+
+
+def json_ld_blocks(html_content):
+    """Yield the decoded JSON-LD blocks of a page, found by a scan for their script tags."""
+    html_content = _as_bytes(html_content)
+    position = 0
+    for _ in range(MAX_JSON_LD_BLOCKS):
+        position = html_content.find(b'application/ld+json', position)
+        if position < 0:
+            return
+        position = html_content.find(b'>', position)
+        if position < 0:
+            return
+        position += 1
+        value = _decode_at(html_content, position)
+        if value is not None:
+            yield value
+
+
+def _offers(value):
+    """Yield every offer under a JSON-LD value: products, @graph members and offer lists."""
+    if isinstance(value, list):
+        for item in value:
+            yield from _offers(item)
+    elif isinstance(value, dict):
+        if '@graph' in value:
+            yield from _offers(value['@graph'])
+        offers = value.get('offers')
+        if isinstance(offers, list):
+            yield from offers
+        elif isinstance(offers, dict):
+            if 'offers' in offers:
+                yield from _offers(offers)
+            yield offers
+
+
+def _url_tokens(url):
+    """Path segments and query values of a URL, whole and split into their alphanumeric parts."""
+    parts = urlsplit(url)
+    values = [segment for segment in parts.path.split('/') if segment]
+    values += [value for _, value in parse_qsl(parts.query)]
+    tokens = set()
+    for value in values:
+        tokens.add(value.lower())
+        tokens.update(token.lower() for token in re.findall(r'[A-Za-z0-9]+', value))
+    return tokens
+
+
+def _offer_matches(offer, url):
+    """
+    Whether an offer is the variant the row's URL points at: the offer's URL has the
+    row's path and its query parameters are all in the row's, or its SKU is in the row's URL.
+    """
+    offer_url = offer.get('url')
+    if isinstance(offer_url, str) and offer_url:
+        offer_parts = urlsplit(urljoin(url, offer_url))
+        row_parts = urlsplit(url)
+        if offer_parts.path.rstrip('/') == row_parts.path.rstrip('/'):
+            row_query = set(parse_qsl(row_parts.query))
+            if all(pair in row_query for pair in parse_qsl(offer_parts.query)):
+                return True
+    sku = offer.get('sku')
+    return sku not in (None, '') and str(sku).lower() in _url_tokens(url)
+
+
+def json_ld_offer(html_content, url=None):
+    """
+    Price and stock of the page's JSON-LD offer.
+    With several priced offers (variants), the one matching url by its URL or SKU is used.
+    Returns {'price': value, 'in_stock': bool}, or None when the page has no priced offer
+    or several and none of them (or more than one) matches url.
+    """
+    offers = []
+    for block in json_ld_blocks(html_content):
+        for offer in _offers(block):
+            if isinstance(offer, dict) and offer.get('price', offer.get('lowPrice')) not in (None, ''):
+                offers.append(offer)
+    if len(offers) > 1:
+        offers = [offer for offer in offers if url and _offer_matches(offer, url)]
+    if len(offers) != 1:
+        return None
+
+    offer = offers[0]
+    availability = str(offer.get('availability', ''))
+    return {
+        'price': offer.get('price', offer.get('lowPrice')),
+        # Missing availability is taken as in stock; OutOfStock, SoldOut and Discontinued aren't
+        'in_stock': not availability or availability.endswith(('InStock', 'LimitedAvailability',
+                                                               'OnlineOnly', 'PreOrder')),
+    }
@@ -0,0 +1,138 @@
+"""
+Retailer extractor registry.
+
+Each retailer registers the function that reads price and stock for one
+watchlist row, and optionally a batch resolver that looks up a whole chunk of
+its rows at once (Power's product API). Rows are matched to a retailer by the
+host of their URL, falling back to the company column, so adding a retailer is
+one decorated function:
+
+    @register('example', hosts=('example.no',))
+    def example(row, batch):
+        return page_fields(row)
+
+page_fields reads JSON-LD offers from the raw page first and builds a DOM for
+the row's CSS selector only when the page has none, or has several variants'
+offers and none of them is the row's.
+"""
+import os
+import sys
+from collections import namedtuple
+
+import scraper
+from extract import extract_fields, json_ld_offer
+from requestcompany import obs, power_prices, power_product_id
+
+# Add shared modules to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
+
+import metrics
+from fetch_engine import host_of
+
+Extractor = namedtuple('Extractor', ['company', 'hosts', 'extract', 'resolve'])
+
+_extractors = {}
+
+
+def register(company, hosts=(), resolve=None):
+    """
+    Register extract(row, batch) -> (price, in_stock) for a retailer.
+    hosts: URL hosts (subdomains included) whose rows use this extractor.
+    resolve(rows) -> batch: called once per chunk with the retailer's rows; its
+    result is passed to extract as batch (None for retailers without one).
+    """
+    def decorator(extract):
+        _extractors[company] = Extractor(company, tuple(hosts), extract, resolve)
+        return extract
+    return decorator
+
+
+def companies():
+    return tuple(_extractors)
+
+
+def find(company, url):
+    """The extractor for a row: by URL host first, then by the company column. None if neither is known."""
+    host = host_of(url)
+    for extractor in _extractors.values():
+        if any(host == known or host.endswith('.' + known) for known in extractor.hosts):
+            return extractor
+    return _extractors.get(company)
+
+
+def resolve_batches(rows):
+    """Run each retailer's batch resolver over its rows of a chunk; returns {company: batch}."""
+    grouped = {}
+    for row in rows:
+        extractor = find(row.company, row.url)
+        if extractor is not None and extractor.resolve is not None:
+            grouped.setdefault(extractor.company, (extractor, []))[1].append(row)
+
+    batches = {}
+    for company, (extractor, company_rows) in grouped.items():
+        try:
+            batches[company] = extractor.resolve(company_rows)
+        except Exception as e:
+            print(f"Error resolving {company} prices: {e}")
+    return batches
+
+
+def extract(row, batches):
+    """Price and stock flag of one row, from its retailer's extractor."""
+    extractor = find(row.company, row.url)
+    if extractor is None:
+        raise ValueError(f"No extractor registered for {row.company} ({host_of(row.url)})")
+    metrics.label('extractor', extractor.company)
+    return extractor.extract(row, batches.get(extractor.company))
+
+
+def page_fields(row):
+    """
+    Fetch a product page and read its price and stock flag, from the JSON-LD offer
+    of the row's variant when there is one and from the row's CSS selector otherwise.
+    """
+    html_content = scraper.fetch_html(row.url)
+    if not html_content:
+        return None, False
+    with metrics.stage('parse'):
+        offer = json_ld_offer(html_content, row.url)
+        if offer is not None:
+            metrics.label('source', 'json-ld')
+            return offer['price'], offer['in_stock']
+        if not row.selector:
+            return None, False
+        metrics.label('source', 'css')
+        fields = extract_fields(html_content, row.selector)
+    return fields['price'], fields['in_stock']
+
+
+# Built-in retailers
+
+@register('rvrc', hosts=('revolutionrace.no', 'revolutionrace.com'))
+def rvrc(row, batch):
+    return page_fields(row)
+
+
+def resolve_power(rows):
+    """Look up every Power row of a chunk in batched API calls."""
+    product_ids = []
+    for row in rows:
+        try:
+            product_ids.append(power_product_id(row.url))
+        except ValueError as e:
+            print(e)
+    return power_prices(product_ids) if product_ids else {}
+
+
+@register('power', hosts=('power.no',), resolve=resolve_power)
+def power(row, batch):
+    # Resolved up front in one batched API call
+    product_id = power_product_id(row.url)
+    if not batch or product_id not in batch:
+        raise ValueError(f"Price not found for Power product {product_id}")
+    return batch[product_id], True
+
+
+@register('obs', hosts=('obs.no',))
+def obs_product(row, batch):
+    return obs(row.url)
@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import sys
+import time
+
+# Add shared modules to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
+
+from utils import parse_price
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_checks (
+    product TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    price INTEGER,
+    raw_price TEXT,
+    in_stock INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_price_checks_product_time ON price_checks (product, checked_at);
+"""
+
+# PRAGMA user_version of the current schema. 1: price is parse_price(raw_price) in
+# kroner; before that it was the digits of the raw price divided by 10.
+# 2: in_stock is NULL when the check found no price, since stock is unknown then
+SCHEMA_VERSION = 2
+
+# Stay well below SQLite's limit on bound parameters per statement
+_MAX_PARAMS = 500
+
+
+class PriceHistory:
+    """
+    Append-only price history in a local SQLite database.
+    Each check is stored as (product, checked_at, price, raw_price, in_stock), keyed by product URL.
+    Prices are in kroner.
+    """
+
+    def __init__(self, db_path):
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        if version < 1:
+            # Recompute every price from the raw text with the one price parser, in SQLite
+            self.conn.create_function('parse_price', 1, parse_price, deterministic=True)
+            with self.conn:
+                cursor = self.conn.execute("UPDATE price_checks SET price = parse_price(raw_price)")
+            if cursor.rowcount:
+                print(f"Recomputed {cursor.rowcount} stored prices")
+        if version < 2:
+            self._allow_unknown_stock()
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _allow_unknown_stock(self):
+        """Drop the NOT NULL on in_stock (a table rebuild in SQLite) and clear it on failed checks."""
+        columns = self.conn.execute("PRAGMA table_info(price_checks)").fetchall()
+        not_null = any(column[1] == 'in_stock' and column[3] for column in columns)
+        with self.conn:
+            if not_null:
+                self.conn.execute("BEGIN")
+                self.conn.execute("ALTER TABLE price_checks RENAME TO price_checks_v1")
+                self.conn.execute("DROP INDEX idx_price_checks_product_time")
+                for statement in SCHEMA.split(';'):
+                    if statement.strip():
+                        self.conn.execute(statement)
+                self.conn.execute("INSERT INTO price_checks SELECT * FROM price_checks_v1")
+                self.conn.execute("DROP TABLE price_checks_v1")
+            self.conn.execute("UPDATE price_checks SET in_stock = NULL WHERE price IS NULL")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record_checks(self, checks):
+        """
+        Append a batch of checks in one transaction.
+        checks: iterable of (product, price, raw_price, in_stock[, checked_at]).
+        in_stock is None when unknown (the check found no price).
+        """
+        now = time.time()
+        rows = []
+        for check in checks:
+            product, price, raw_price, in_stock = check[:4]
+            checked_at = check[4] if len(check) > 4 else now
+            rows.append((product, checked_at, price, raw_price, None if in_stock is None else int(bool(in_stock))))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO price_checks (product, checked_at, price, raw_price, in_stock) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def latest_prices(self, products=None):
+        """
+        Latest check with a price per product; failed checks (price NULL) are
+        skipped, so a failed fetch doesn't make the next run compare against the CSV price.
+        Returns {product: (checked_at, price, raw_price, in_stock)}.
+        """
+        query = """
+            SELECT p.product, p.checked_at, p.price, p.raw_price, p.in_stock
+            FROM price_checks p
+            WHERE p.price IS NOT NULL AND p.checked_at = (
+                SELECT MAX(checked_at) FROM price_checks WHERE product = p.product AND price IS NOT NULL
+            )
+        """
+        if products is None:
+            return {row[0]: row[1:] for row in self.conn.execute(query)}
+
+        products = list(products)
+        latest = {}
+        for start in range(0, len(products), _MAX_PARAMS):
+            chunk = products[start:start + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.conn.execute(f"{query} AND p.product IN ({placeholders})", chunk):
+                latest[row[0]] = row[1:]
+        return latest
+
+    def all_time_lows(self, products):
+        """Lowest recorded price per product, as {product: price}; products without prices are left out."""
+        products = list(products)
+        lows = {}
+        for start in range(0, len(products), _MAX_PARAMS):
+            chunk = products[start:start + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            lows.update(self.conn.execute(
+                f"SELECT product, MIN(price) FROM price_checks "
+                f"WHERE product IN ({placeholders}) AND price IS NOT NULL GROUP BY product",
+                chunk,
+            ))
+        return lows
+
+    def price_range(self, product, since, until=None):
+        """Return (min_price, max_price) for a product between since and until (epoch seconds)."""
+        until = time.time() if until is None else until
+        return self.conn.execute(
+            "SELECT MIN(price), MAX(price) FROM price_checks "
+            "WHERE product = ? AND checked_at BETWEEN ? AND ? AND price IS NOT NULL",
+            (product, since, until),
+        ).fetchone()
+
+    def history(self, product):
+        """All checks for a product, oldest first, as (checked_at, price, raw_price, in_stock)."""
+        return self.conn.execute(
+            "SELECT checked_at, price, raw_price, in_stock FROM price_checks WHERE product = ? ORDER BY checked_at",
+            (product,),
+        ).fetchall()
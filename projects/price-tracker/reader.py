@@ -1,88 +1,244 @@
+import argparse
 import os
-import pandas as pd
-import scraper
-import requests
 import sys
 from bs4 import MarkupResemblesLocatorWarning
 import warnings
-from requestcompany import power, obs
-from Utils.utils import clean_number
+import alerts
+import extractors
+from history import PriceHistory
+from watchlist import iter_rows, iter_chunks
+
+# Add shared modules to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
+
+from notifications import queue_notification, flush_notifications
+from fetch_engine import FetchEngine, host_of
+import http_client
+import metrics
+from metrics import RunMetrics
+from sharding import add_shard_arguments, worker_from_args
+from polling import AdaptivePolicy, PollState
+from resilience import CircuitOpenError
+from utils import parse_price
 
 warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
 
-def price_change(old_price, new_price, company, webhook, url):
-    old_price_cleaned = int(clean_number(old_price))
-    cleaned_new_price = clean_number(new_price)
+def send_alerts(batch_alerts, webhook, alert_once=None):
+    for alert in batch_alerts:
+        # Sharded workers skip alerts another worker already sent for this run
+        if alert_once and not alert_once(alert.key):
+            continue
+        # Sent in the background; alerts from the same run are merged into fewer posts
+        queue_notification(alert.message, webhook)
+
+
+def fetch_row(row, batches):
+    """
+    Fetch the current price for one watchlist row with its retailer's extractor.
+    Runs on a fetch engine worker; batches holds the chunk's batched lookups by retailer.
+    """
+    with metrics.target(row.url, company=row.company):
+        # Rows of a retailer that kept failing are skipped until its breaker's cool-down is over
+        http_client.check_circuit(row.url)
+        price, in_stock = extractors.extract(row, batches)
+        if price is None:
+            metrics.fail("no price found")
+        return price, in_stock
+
+
+def default_history_path(file_path):
+    """The price history database lives next to the watchlist."""
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), 'price-history.sqlite3')
+
+
+def default_poll_state_path(file_path):
+    """
+    Adaptive polling state lives in .cache/ next to the watchlist, out of the committed
+    data directory, since every run rewrites it. A poll-state.json beside the watchlist is moved there.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    path = os.path.join(directory, '.cache', 'poll-state.json')
+    legacy_path = os.path.join(directory, 'poll-state.json')
+    if os.path.exists(legacy_path) and not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(legacy_path, path)
+    return path
+
+
+def base_interval(row):
+    """The row's interval_minutes column in seconds, or None when it isn't set."""
     try:
-        new_price_cleaned = int(cleaned_new_price)
-    except ValueError:
-        print(f"Error converting cleaned new price to int: {cleaned_new_price}")
-        return
+        minutes = float(row.interval_minutes)
+    except (TypeError, ValueError):
+        return None
+    return minutes * 60 if minutes > 0 else None
+
+
+def due_rows(rows, poll_state):
+    """Yield the rows the adaptive poll state says are due; report how many were skipped."""
+    skipped = 0
+    for row in rows:
+        if poll_state.is_due(row.url):
+            yield row
+        else:
+            skipped += 1
+    if skipped:
+        print(f"Skipped {skipped} products that are not due yet")
 
-    if new_price_cleaned < old_price_cleaned:
-        message = (f"The price has gone down! It was {old_price_cleaned} kr, now it's {new_price_cleaned} kr. It has "
-                   f"decreased by {old_price_cleaned - new_price_cleaned} kr for {company} page.\nLink: {url}")
-        send_discord_message(message, webhook)
 
-def send_discord_message(message, webhook):
-    data = {
-        "content": message
-    }
-    response = requests.post(webhook, json=data)
-    if response.status_code != 204:
-        print(f"Failed to send message to Discord: {response.status_code}, {response.text}")
+def load_watchlist(file_path):
+    """Read the whole watchlist into a list of WatchlistRows (for callers that need random access)."""
+    return list(iter_rows(_existing_path(file_path)))
 
-def track_prices(file_path, webhook):
+
+def _existing_path(file_path):
     abs_file_path = os.path.abspath(file_path)
     if not os.path.isfile(abs_file_path):
         raise FileNotFoundError(f"The file {abs_file_path} does not exist.")
+    return abs_file_path
 
-    df = pd.read_csv(abs_file_path, delimiter=',')  # Ensure correct delimiter
-    df['price'] = df['price'].astype(str)  # Cast the price column to string
 
-    for index, row in df.iterrows():
-        url_variable = row['url']
-        selector = row['selector']
-        old_price = row['price']
-        company = row['company']
+def check_products(rows, webhook, history_path, max_workers=16, per_host_limit=4, timeout=60,
+                   chunk_size=1000, alert_once=None, poll_state=None):
+    """
+    Check watchlist rows, evaluate the alert rules and record every check.
+    rows may be a stream: it is consumed chunk by chunk as the fetch engine has room,
+    and per-chunk lookups (stored prices, batched retailer APIs) happen as each chunk is read.
+    Results are handled in batches of chunk_size: the alert rules run over a whole batch
+    at once (see alerts.py) and the batch is written to the history in one transaction.
+    alert_once(key) is asked before each alert and returns False for alerts already sent.
+    poll_state (a polling.PollState) gets whether each product's price or stock changed.
+    """
+    # Compare against the last stored price; the CSV price is only the starting point
+    with PriceHistory(history_path) as history:
 
-        # Ensure the URL is valid
-        if not url_variable.startswith('http'):
-            print(f"Skipping invalid URL: {url_variable}")
-            continue
+        def prepared_rows():
+            for chunk in iter_chunks(rows, chunk_size):
+                batches = extractors.resolve_batches(chunk)
+                latest = history.latest_prices(row.url for row in chunk)
+                for row in chunk:
+                    stored = latest.get(row.url)
+                    old_price = stored[1] if stored and stored[1] is not None else parse_price(row.price)
+                    old_in_stock = bool(stored[3]) if stored and stored[3] is not None else None
+                    yield row, old_price, old_in_stock, batches
+
+        checks = []
+
+        def flush():
+            if not checks:
+                return
+            # All-time lows are read before the batch itself is recorded
+            with metrics.stage('alerts'):
+                lows = history.all_time_lows(check.row.url for check in checks)
+                batch_alerts = alerts.alerts(checks, lows)
+            send_alerts(batch_alerts, webhook, alert_once)
+            out_of_stock = sum(1 for check in checks if check.in_stock is False)
+            no_price = sum(1 for check in checks if check.price is None)
+            print(f"Checked {len(checks)} products: {len(batch_alerts)} alerts, {out_of_stock} out of stock"
+                  + (f", {no_price} without a price" if no_price else ""))
+            with metrics.stage('history'):
+                history.record_checks(
+                    (check.row.url, check.price, None if raw is None else str(raw), check.in_stock)
+                    for check, raw in zip(checks, raw_prices)
+                )
+            checks.clear()
+            raw_prices.clear()
+
+        raw_prices = []
+        skipped = {}
+        engine = FetchEngine(max_workers=max_workers, per_host_limit=per_host_limit, timeout=timeout,
+                             max_pending=chunk_size)
+        # Results arrive in completion order, so one slow retailer doesn't hold up the rest
+        for result in engine.run(lambda item: fetch_row(item[0], item[3]), prepared_rows(),
+                                 key=lambda item: host_of(item[0].url)):
+            row, old_price, old_in_stock, _ = result.item
+
+            if isinstance(result.error, CircuitOpenError):
+                skipped[result.error.host] = skipped.get(result.error.host, 0) + 1
+                continue
+            if not result.ok:
+                print(f"Error checking {row.url}: {result.error}")
+                continue
+
+            raw_price, in_stock = result.value
+            new_price = parse_price(raw_price)
+            # Without a price the page wasn't read, so its stock flag says nothing either
+            in_stock = None if new_price is None else bool(in_stock)
+            checks.append(alerts.Check(row, new_price, old_price, in_stock, old_in_stock))
+            raw_prices.append(raw_price)
+            # A failed read is neither a change nor a sign of stability; the interval stays as it is
+            if poll_state is not None and new_price is not None:
+                # Any price move or stock flip resets the product to the shortest interval
+                changed = (new_price != old_price
+                           or (old_in_stock is not None and old_in_stock != in_stock))
+                poll_state.record(row.url, changed, base=base_interval(row))
+
+            if len(checks) >= chunk_size:
+                flush()
+
+        flush()
+        for host, count in skipped.items():
+            print(f"Skipped {count} products on {host}: circuit open after repeated failures")
+        if poll_state is not None:
+            poll_state.save()
 
-        new_prices, html_contents = scraper.get_page([url_variable], [selector])
-        new_price = new_prices[0]
-
-        if company == 'rvrc':
-            if scraper.check_medium_in_stock(url_variable, selector):
-                print("Item is in stock")
-                if clean_number(new_price) != clean_number(old_price):
-                    price_change(old_price, new_price, company, webhook, url_variable)
-                else:
-                    print("Price has not changed")
-            else:
-                print(f"Item in {company} is out of stock")
-        elif company == 'power':
-            new_price_request = power()
-            if clean_number(new_price_request) != clean_number(old_price):
-                price_change(old_price, new_price_request, company, webhook, url_variable)
-            else:
-                print(f"Price has not changed for {company}")
-        elif company == 'obs':
-            new_price_request = obs()
-            if clean_number(new_price_request) != clean_number(old_price):
-                price_change(old_price, new_price_request, company, webhook, url_variable)
-            else:
-                print(f"Price has not changed for {company}")
-        else:
-            print(f"Company {company} not supported")
+
+def track_prices(file_path, webhook, max_workers=16, per_host_limit=4, timeout=60, history_path=None,
+                 worker=None, poll_state=None):
+    """
+    Check every product of the watchlist.
+    worker: a sharding.ShardWorker; only the rows of the shards it claims are checked.
+    poll_state: a polling.PollState; products that aren't due yet are skipped.
+    """
+    abs_file_path = _existing_path(file_path)
+    history_path = history_path or default_history_path(abs_file_path)
+
+    def watchlist_rows(shard=None):
+        rows = iter_rows(abs_file_path)
+        if shard is not None:
+            rows = (row for row in rows if worker.ring.shard_of_url(row.url) == shard)
+        return due_rows(rows, poll_state) if poll_state is not None else rows
+
+    if worker is None:
+        check_products(watchlist_rows(), webhook, history_path, max_workers=max_workers,
+                       per_host_limit=per_host_limit, timeout=timeout, poll_state=poll_state)
+        return
+
+    for shard in worker.shards():
+        print(f"Checking shard {shard + 1}/{worker.shard_count} as {worker.worker_id}")
+        check_products(watchlist_rows(shard), webhook, history_path, max_workers=max_workers,
+                       per_host_limit=per_host_limit, timeout=timeout, alert_once=worker.alert_once,
+                       poll_state=poll_state)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check watchlist prices and alert on drops.")
+    parser.add_argument('--watchlist', default='data/rvrc-data.csv')
+    parser.add_argument('--min-interval', type=float, default=240,
+                        help="Minutes between checks of a product whose price just changed")
+    parser.add_argument('--max-interval', type=float, default=7 * 24 * 60,
+                        help="Longest a stable product goes between checks, in minutes")
+    parser.add_argument('--fixed-interval', action='store_true',
+                        help="Check every product on every run instead of backing off on stable ones")
+    add_shard_arguments(parser)
+    args = parser.parse_args()
+
     webhook_url = os.getenv('DISCORD_WEBHOOK')
     if not webhook_url:
         print("Environment variable DISCORD_WEBHOOK is not set.")
         sys.exit(1)
 
-    track_prices('data/rvrc-data.csv', webhook_url)
\ No newline at end of file
+    # Workers of a sharded run share a lease store next to the watchlist by default
+    worker = worker_from_args(args, os.path.join(os.path.dirname(os.path.abspath(args.watchlist)), 'shards.sqlite3'))
+
+    poll_state = None
+    if not args.fixed_interval:
+        poll_state = PollState(default_poll_state_path(args.watchlist),
+                               AdaptivePolicy(args.min_interval * 60, args.max_interval * 60))
+
+    # Stage timings go to METRICS_LOG / METRICS_TEXTFILE_DIR when set
+    with RunMetrics('price_tracker'):
+        try:
+            track_prices(args.watchlist, webhook_url, worker=worker, poll_state=poll_state)
+        finally:
+            flush_notifications()
\ No newline at end of file
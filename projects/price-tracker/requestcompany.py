@@ -1,62 +1,81 @@
-import requests
+import os
+import sys
 import re
-import json
-from Utils.utils import clean_number
+from extract import embedded_json
 
+# Add shared modules to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-def power():
-    # API URL
-    url = "https://www.power.no/api/v2/products?ids=3251951"
+import http_client
+import metrics
+import scraper
+from utils import parse_price
 
-    # Headers (Optional, to mimic a browser)
-    headers = {"User-Agent": "Mozilla/5.0"}
 
-    # Fetch the JSON response
-    response = requests.get(url, headers=headers)
-    data = response.json()  # Convert response to JSON
+POWER_API_URL = "https://www.power.no/api/v2/products"
 
-    # Extract the price
-    if data and "price" in data[0]:
-        price = data[0]["price"]  # Since it's inside a list
-        price = clean_number(price)  # Clean the price
-    else:
-        raise ValueError("Price not found in the response")
+# Product ids per API call; keeps the query string well under URL length limits
+POWER_BATCH_SIZE = 50
 
-    return price
 
+def power_product_id(url):
+    """Extract the Power product id from the p-<id> segment of a product URL."""
+    match = re.search(r'/p-(\d+)(?:/|$|\?)', url)
+    if not match:
+        raise ValueError(f"No Power product id found in {url}")
+    return match.group(1)
 
-def obs():
-    # API URL
-    url = "https://www.obs.no/klar/herreklar/jakker-herre/vatterte-jakker-herre/2840945?v=Obs-7022324994646"
 
-    # Headers (Optional, to mimic a browser)
-    headers = {"User-Agent": "Mozilla/5.0"}
+def power_prices(product_ids, batch_size=POWER_BATCH_SIZE):
+    """
+    Look up several Power products with one API call per batch.
+    Returns {product_id: price}; ids missing from the response are left out.
+    """
+    product_ids = list(dict.fromkeys(str(product_id) for product_id in product_ids))
+    prices = {}
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start:start + batch_size]
 
-    # Fetch the JSON response
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200 and response.content:
-        match = re.search(r'window\.CURRENT_PAGE\s*=\s*({.*?});', response.text, re.DOTALL)
-        if match:
-            json_str = match.group(1)
-            try:
-                data = json.loads(json_str)  # Parse the JSON object
+        # Fetch the JSON response (the shared client sends a browser User-Agent)
+        with metrics.stage('power_api'):
+            response = http_client.get(POWER_API_URL, params={"ids": ",".join(chunk)})
+        response.raise_for_status()
+        data = response.json() or []
 
-            except json.JSONDecodeError:
-                raise ValueError("Extracted content is not valid JSON")
-        else:
-            raise ValueError("window.CURRENT_PAGE not found in the response")
-    else:
-        raise ValueError("Failed to fetch data or empty response")
+        for position, product in enumerate(data):
+            if "price" not in product:
+                continue
+            product_id = product.get("productId", product.get("id"))
+            if product_id is None and len(data) == len(chunk):
+                # Fall back to request order if the API doesn't echo the id
+                product_id = chunk[position]
+            price = parse_price(product["price"])
+            if product_id is not None and price is not None:
+                prices[str(product_id)] = price
 
-    # Extract the price
-    if data and "price" in data and "current" in data["price"] and "inclVat" in data["price"]["current"]:
-        price = data["price"]["current"]["inclVat"]
-        price = clean_number(price)  # Clean the price
-    else:
-        raise ValueError("Price not found in the response")
+    return prices
 
-    return price
 
+def obs(url):
+    """
+    Price and stock of an OBS product page, read from its embedded window.CURRENT_PAGE
+    state without parsing the rest of the page.
+    """
+    html_content = scraper.fetch_html(url)
+    if not html_content:
+        raise ValueError("Failed to fetch data or empty response")
+
+    with metrics.stage('parse'):
+        data = embedded_json(html_content, 'window.CURRENT_PAGE')
+    if not isinstance(data, dict):
+        raise ValueError("window.CURRENT_PAGE not found in the response")
 
-if __name__ == '__main__':
-    obs()
+    # Extract the price
+    try:
+        price = parse_price(data["price"]["current"]["inclVat"])
+    except (KeyError, TypeError):
+        price = None
+    if price is None:
+        raise ValueError("Price not found in the response")
+    in_stock = (data.get("stock") or {}).get("online", True)
+    return price, bool(in_stock)
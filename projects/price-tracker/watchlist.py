@@ -0,0 +1,72 @@
+"""
+Streaming watchlist reader.
+
+Rows are read straight from the CSV with the csv module, validated as they
+are read and yielded in chunks, so memory stays flat no matter how long the
+watchlist is and pandas is not needed.
+"""
+import csv
+import os
+import sys
+from collections import namedtuple
+from itertools import islice
+from urllib.parse import urlsplit
+
+import extractors
+
+# Add shared modules to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
+
+from utils import parse_price
+
+# target_price, min_drop (kroner) and min_drop_percent are optional alert thresholds, None when unset
+WatchlistRow = namedtuple('WatchlistRow', ['url', 'selector', 'price', 'company', 'interval_minutes',
+                                           'target_price', 'min_drop', 'min_drop_percent'],
+                          defaults=(None, None, None, None))
+
+
+def validate_row(record, line_number):
+    """Build a WatchlistRow from a CSV record, or print why it is skipped and return None."""
+    url = (record.get('url') or '').strip()
+    company = (record.get('company') or '').strip()
+
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        print(f"Skipping invalid URL on line {line_number}: {url}")
+        return None
+    # The URL's host picks the retailer; the company column is only needed for unknown hosts
+    extractor = extractors.find(company, url)
+    if extractor is None:
+        print(f"Company {company} not supported (line {line_number})")
+        return None
+
+    return WatchlistRow(
+        url=url,
+        selector=record.get('selector') or '',
+        price=str(record.get('price') or ''),
+        company=extractor.company,
+        interval_minutes=record.get('interval_minutes') or None,
+        target_price=parse_price(record.get('target_price') or None),
+        min_drop=parse_price(record.get('min_drop') or None),
+        min_drop_percent=parse_price(record.get('min_drop_percent') or None),
+    )
+
+
+def iter_rows(file_path):
+    """Yield valid WatchlistRows one at a time."""
+    with open(file_path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f, delimiter=',')
+        for record in reader:
+            row = validate_row(record, reader.line_num)
+            if row is not None:
+                yield row
+
+
+def iter_chunks(rows, chunk_size=1000):
+    """Group an iterable of rows into lists of at most chunk_size."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
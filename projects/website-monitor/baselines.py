@@ -0,0 +1,210 @@
+"""
+Content-addressed screenshot baselines.
+
+Each baseline is stored once as baselines/<sha256>.png, where the hash is of
+the screenshot as captured, recompressed losslessly at the highest PNG level.
+baselines/index.json records, per website, the current baseline, its
+perceptual fingerprint and the previous baselines kept by the retention policy.
+
+Nothing is written when a screenshot hashes to the current baseline, or when
+its fingerprint matches the current one (no visible change); an unchanged
+page costs one hash and, at most, one small resize.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import cv2
+import numpy as np
+
+# The fingerprint is a difference hash plus the mean brightness of each cell of a
+# FINGERPRINT_COLUMNS wide grid, one row of cells per FINGERPRINT_ROW_HEIGHT pixels of page height
+FINGERPRINT_COLUMNS = 32
+FINGERPRINT_ROW_HEIGHT = 64
+
+# Gray levels a cell's mean may move by rendering noise alone. Covering 5% of a cell
+# with a change the pixel diff counts (more than 80 levels) moves its mean by at least 4
+FINGERPRINT_MEAN_TOLERANCE = 3
+
+# Baselines kept per website, the current one included
+DEFAULT_RETENTION = 3
+
+# Fingerprints differing in at most this fraction of bits count as the same picture
+FINGERPRINT_TOLERANCE = 0.002
+
+PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 9]
+
+
+def content_digest(png: bytes) -> str:
+    return hashlib.sha256(png).hexdigest()
+
+
+def decode_png(data: bytes) -> Optional[np.ndarray]:
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def perceptual_fingerprint(img: np.ndarray) -> str:
+    """
+    Downscaled difference hash and cell means of a screenshot, as hex.
+    Each bit says whether a grid cell is brighter than its right neighbour, so
+    sub-pixel rendering noise doesn't change it but moved or replaced blocks do;
+    the means catch what the hash can't see, like a uniform block recoloured.
+    The image size is part of the fingerprint.
+    """
+    height, width = img.shape[:2]
+    rows = max(1, height // FINGERPRINT_ROW_HEIGHT)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (FINGERPRINT_COLUMNS + 1, rows), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return f"{width}x{height}:{bits.tobytes().hex()}:{small.tobytes().hex()}"
+
+
+def write_blob(path: str, png: bytes, img: np.ndarray) -> None:
+    """
+    Store a screenshot at its content-addressed path, losslessly recompressed when
+    that is smaller. Safe to call from several threads and processes at once.
+    """
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ok, encoded = cv2.imencode('.png', img, PNG_PARAMS)
+    data = encoded.tobytes() if ok and len(encoded) < len(png) else png
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def fingerprint_distance(fingerprint1: str, fingerprint2: str) -> float:
+    """
+    Fraction of differing hash bits or of cells whose mean moved by more than
+    FINGERPRINT_MEAN_TOLERANCE, whichever is larger; 1.0 when the image sizes
+    (or fingerprint formats) differ.
+    """
+    parts1 = fingerprint1.split(':')
+    parts2 = fingerprint2.split(':')
+    if len(parts1) != 3 or parts1[0] != parts2[0] or [len(part) for part in parts1] != [len(part) for part in parts2]:
+        return 1.0
+    _, bits1, means1 = parts1
+    _, bits2, means2 = parts2
+    if not bits1:
+        return 0.0
+    xor = np.bitwise_xor(np.frombuffer(bytes.fromhex(bits1), dtype=np.uint8),
+                         np.frombuffer(bytes.fromhex(bits2), dtype=np.uint8))
+    moved = np.abs(np.frombuffer(bytes.fromhex(means1), dtype=np.uint8).astype(np.int16)
+                   - np.frombuffer(bytes.fromhex(means2), dtype=np.uint8)) > FINGERPRINT_MEAN_TOLERANCE
+    return max(int(np.unpackbits(xor).sum()) / (len(bits1) * 4), float(moved.mean()))
+
+
+class BaselineStore:
+    def __init__(self, directory: str, retention: int = DEFAULT_RETENTION):
+        self.directory = directory
+        self.retention = max(1, retention)
+        self.index_path = os.path.join(directory, 'index.json')
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict[str, Any]] = self._load_index()
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.png")
+
+    def current(self, name: str) -> Optional[Dict[str, Any]]:
+        """The current baseline entry of a website: {'sha256', 'fingerprint', 'since'}."""
+        with self._lock:
+            entry = self._index.get(name)
+            return dict(entry['current']) if entry else None
+
+    def load(self, name: str) -> Optional[np.ndarray]:
+        """Decode the current baseline of a website."""
+        entry = self.current(name)
+        if entry is None:
+            return None
+        try:
+            with open(self.blob_path(entry['sha256']), 'rb') as f:
+                return decode_png(f.read())
+        except FileNotFoundError:
+            return None
+
+    def update(self, name: str, png: bytes, img: Optional[np.ndarray] = None,
+               digest: Optional[str] = None, fingerprint: Optional[str] = None) -> bool:
+        """
+        Make a screenshot the current baseline of a website.
+        Returns False (and writes nothing) when it is already the current baseline.
+        img, digest and fingerprint can be passed in when the caller already has them;
+        when the blob was already written (e.g. by a diff worker) and the fingerprint
+        is given, the screenshot isn't decoded at all.
+        """
+        digest = digest or content_digest(png)
+        with self._lock:
+            entry = self._index.get(name)
+            if entry and entry['current']['sha256'] == digest:
+                return False
+
+        blob_path = self.blob_path(digest)
+        if img is None and (fingerprint is None or not os.path.exists(blob_path)):
+            img = decode_png(png)
+            if img is None:
+                raise ValueError(f"Screenshot for {name} is not a valid PNG")
+        fingerprint = fingerprint or perceptual_fingerprint(img)
+        write_blob(blob_path, png, img)
+
+        with self._lock:
+            entry = self._index.setdefault(name, {'history': []})
+            if 'current' in entry:
+                entry['history'].insert(0, entry['current'])
+            entry['current'] = {'sha256': digest, 'fingerprint': fingerprint, 'since': int(time.time())}
+            dropped = entry['history'][self.retention - 1:]
+            del entry['history'][self.retention - 1:]
+            self._prune(dropped)
+            self._save_index()
+        return True
+
+    def _prune(self, dropped: Iterable[Dict[str, Any]]) -> None:
+        """
+        Delete the blobs of dropped baseline entries that no website references any more.
+        Only dropped blobs are candidates, so blobs being written for an update that
+        hasn't reached the index yet are never touched.
+        """
+        candidates = {old['sha256'] for old in dropped}
+        if not candidates:
+            return
+        referenced = set()
+        for entry in self._index.values():
+            referenced.add(entry['current']['sha256'])
+            referenced.update(old['sha256'] for old in entry.get('history', []))
+        for digest in candidates - referenced:
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def retain(self, names: Iterable[str]) -> None:
+        """Forget the baselines of websites that are no longer configured."""
+        names = set(names)
+        with self._lock:
+            removed = [name for name in self._index if name not in names]
+            if not removed:
+                return
+            dropped = []
+            for name in removed:
+                entry = self._index.pop(name)
+                dropped += [entry['current']] + entry.get('history', [])
+            self._prune(dropped)
+            self._save_index()
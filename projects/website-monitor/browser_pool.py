@@ -0,0 +1,189 @@
+"""
+Long-lived Chromium with a pool of reusable contexts and pages.
+
+Playwright's sync API is bound to the thread that started it, so the pool
+runs the async API on its own event loop thread and exposes blocking,
+thread-safe wrappers. Any number of monitor threads can lease pages; at most
+max_pages are open at once and the browser is launched only once per run,
+or again when it crashes or disconnects.
+"""
+
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from playwright.async_api import async_playwright
+
+
+class PooledPage:
+    """Blocking handle to a leased Playwright page."""
+
+    def __init__(self, pool: "BrowserPool", page):
+        self._pool = pool
+        self._page = page
+
+    def goto(self, url: str, timeout: float = 60000) -> None:
+        """Navigate and wait until the network has been idle."""
+        async def _goto():
+            await self._page.goto(url, timeout=timeout)
+            await self._page.wait_for_load_state('networkidle', timeout=timeout)
+        self._pool._call(_goto())
+
+    def content(self) -> str:
+        """Return the rendered DOM as HTML."""
+        return self._pool._call(self._page.content())
+
+    def screenshot(self, output_path: Optional[str] = None, full_page: bool = True) -> bytes:
+        """Screenshot the current page; returns the PNG bytes."""
+        return self._pool._call(self._page.screenshot(path=output_path, full_page=full_page))
+
+    def screenshot_elements(self, selectors: Dict[str, str]) -> Optional[Dict[str, bytes]]:
+        """
+        Screenshot the bounding box of the first element matching each selector.
+        Returns {name: PNG bytes}, or None when any element is missing or not visible.
+        """
+        async def _screenshots():
+            screenshots = {}
+            for name, selector in selectors.items():
+                element = await self._page.query_selector(selector)
+                box = await element.bounding_box() if element is not None else None
+                if not box or box['width'] < 1 or box['height'] < 1:
+                    return None
+                screenshots[name] = await element.screenshot()
+            return screenshots
+        return self._pool._call(_screenshots())
+
+
+class BrowserPool:
+    def __init__(self, max_pages: int = 4, headless: bool = True):
+        self.max_pages = max(1, max_pages)
+        self.headless = headless
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._playwright = None
+        self._browser = None
+        self._idle: List[Tuple[object, object]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._relaunch_lock: Optional[asyncio.Lock] = None
+
+    def _call(self, coro):
+        """Run a coroutine on the pool's event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def start(self) -> None:
+        """Launch the event loop thread and Chromium, once."""
+        with self._start_lock:
+            if self._browser is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            self._thread.start()
+            try:
+                self._call(self._launch())
+            except Exception:
+                self._stop_loop()
+                raise
+
+    async def _launch(self) -> None:
+        self._slots = asyncio.Semaphore(self.max_pages)
+        self._relaunch_lock = asyncio.Lock()
+        self._playwright = await async_playwright().start()
+        try:
+            self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        except Exception:
+            await self._playwright.stop()
+            self._playwright = None
+            raise
+
+    async def _relaunch_if_disconnected(self) -> None:
+        """Launch a new Chromium when the current one crashed or was closed; its idle contexts go with it."""
+        async with self._relaunch_lock:
+            if self._browser.is_connected():
+                return
+            print("Browser disconnected, relaunching Chromium")
+            self._idle.clear()
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = await self._playwright.chromium.launch(headless=self.headless)
+
+    async def _acquire(self):
+        await self._slots.acquire()
+        try:
+            await self._relaunch_if_disconnected()
+            if self._idle:
+                return self._idle.pop()
+            context = await self._browser.new_context()
+            return context, await context.new_page()
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def _release(self, lease, reusable: bool) -> None:
+        context, page = lease
+        try:
+            if reusable and not page.is_closed():
+                # Don't leak one site's cookies into the next
+                await context.clear_cookies()
+                self._idle.append(lease)
+            else:
+                await context.close()
+        except Exception:
+            pass
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def page(self) -> Iterator[PooledPage]:
+        """Lease a page; blocks while max_pages pages are in use."""
+        self.start()
+        lease = self._call(self._acquire())
+        reusable = False
+        try:
+            yield PooledPage(self, lease[1])
+            reusable = True
+        finally:
+            # A page that errored may be in a bad state, so it is discarded
+            self._call(self._release(lease, reusable))
+
+    async def _shutdown(self) -> None:
+        for context, _ in self._idle:
+            try:
+                await context.close()
+            except Exception:
+                pass
+        self._idle.clear()
+        if self._browser is not None:
+            await self._browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+
+    def _stop_loop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    def close(self) -> None:
+        """Close all pages, the browser and the event loop thread."""
+        with self._start_lock:
+            if self._loop is None:
+                return
+            try:
+                self._call(self._shutdown())
+            except Exception as e:
+                print(f"Error closing browser: {e}")
+            finally:
+                self._browser = None
+                self._playwright = None
+                self._stop_loop()
+
+    def __enter__(self) -> "BrowserPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,89 @@
+"""
+Single-pass page normalization for content hashing.
+
+Noise nodes (scripts, styles, timestamps, session ids, ads, cookie banners and
+any site-specific ignore rules) are found in one traversal using one matcher,
+and all configured selectors are then extracted in one more traversal.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import soupsieve
+from bs4 import BeautifulSoup, Tag
+
+# Equivalent to removing script/style/noscript and then the CSS selectors
+# [id*="timestamp"], [class*="timestamp"], [id*="session"], [class*="session"],
+# [id*="random"], [class*="random"], [class*="ad"], [id*="ad"],
+# .cookie-banner, .cookie-notice, [data-timestamp], [data-session]
+NOISE_TAGS = frozenset(['script', 'style', 'noscript'])
+NOISE_SUBSTRINGS = ('timestamp', 'session', 'random', 'ad')
+NOISE_CLASSES = frozenset(['cookie-banner', 'cookie-notice'])
+NOISE_ATTRIBUTES = ('data-timestamp', 'data-session')
+
+
+@lru_cache(maxsize=256)
+def compile_selector(selector: str):
+    return soupsieve.compile(selector)
+
+
+class ContentFilter:
+    def __init__(self, ignore_selectors: Optional[Iterable[str]] = None):
+        """ignore_selectors: extra CSS selectors from the site config, merged into one matcher."""
+        ignore_selectors = [s for s in (ignore_selectors or []) if s]
+        self.extra = compile_selector(', '.join(ignore_selectors)) if ignore_selectors else None
+
+    def is_noise(self, tag: Tag) -> bool:
+        if tag.name in NOISE_TAGS:
+            return True
+        attrs = tag.attrs
+        element_id = attrs.get('id')
+        classes = attrs.get('class')
+        if isinstance(classes, list):
+            if NOISE_CLASSES.intersection(classes):
+                return True
+            classes = ' '.join(classes)
+        for substring in NOISE_SUBSTRINGS:
+            if (element_id and substring in element_id) or (classes and substring in classes):
+                return True
+        for attribute in NOISE_ATTRIBUTES:
+            if attribute in attrs:
+                return True
+        return self.extra is not None and self.extra.match(tag)
+
+    def strip(self, soup: BeautifulSoup) -> None:
+        """Remove every noise node in a single traversal; subtrees of removed nodes are not visited."""
+        noise: List[Tag] = []
+        stack = [soup]
+        while stack:
+            node = stack.pop()
+            for child in node.contents:
+                if not isinstance(child, Tag):
+                    continue
+                if self.is_noise(child):
+                    noise.append(child)
+                else:
+                    stack.append(child)
+        for element in noise:
+            element.decompose()
+
+
+def extract_selectors(soup: BeautifulSoup, selectors: Dict[str, str]) -> Dict[str, str]:
+    """
+    Extract the text of every configured selector with one traversal.
+    Returns {name: matched texts joined by newlines, or "" when nothing matched}.
+    """
+    combined = compile_selector(', '.join(f':is({selector})' for selector in selectors.values()))
+    patterns = [(name, compile_selector(selector)) for name, selector in selectors.items()]
+    texts: Dict[str, List[str]] = {name: [] for name in selectors}
+
+    for element in combined.select(soup):
+        text = None
+        for name, pattern in patterns:
+            if pattern.match(element):
+                if text is None:
+                    # One line per text node, so changes can be diffed line by line
+                    text = element.get_text('\n', strip=True)
+                texts[name].append(text)
+
+    return {name: '\n'.join(parts) for name, parts in texts.items()}
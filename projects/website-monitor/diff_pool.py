@@ -0,0 +1,146 @@
+"""
+Process pool for screenshot decoding and diffing.
+
+PNG decoding, fingerprinting and the tiled diff are CPU-bound and hold the
+GIL for most of their time, so they run in worker processes. A screenshot is
+copied once into a shared memory block and the worker decodes straight out
+of it; the baseline is read by the worker from the baseline store on disk,
+so no image is pickled. The worker also writes the new baseline blob, which
+leaves the monitor thread only the index update.
+
+A monitor thread hands its screenshot off as soon as it is taken and waits
+for the result without holding a browser page, so the other threads keep
+capturing while earlier screenshots are diffed and diff time scales with
+the number of cores instead of the number of pages.
+"""
+
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+from baselines import FINGERPRINT_TOLERANCE, fingerprint_distance, perceptual_fingerprint, write_blob
+from image_diff import diff_images
+
+# has_change: significant visual change; matched: the fingerprint matched the
+# baseline, so the baseline stays as it is
+VisualResult = namedtuple('VisualResult', ['fingerprint', 'matched', 'has_change', 'percentage'])
+
+
+def visual_check(png: Union[bytes, memoryview], blob_path: str, baseline_path: Optional[str],
+                 baseline_fingerprint: Optional[str], diff_path: str) -> Optional[VisualResult]:
+    """
+    Decode a screenshot, compare its fingerprint with the baseline's and, when it
+    differs, store it as blob_path and diff it against the baseline at baseline_path.
+    The highlighted diff is written to diff_path when the change is significant.
+    Returns None when the screenshot can't be decoded.
+    """
+    img = cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    fingerprint = perceptual_fingerprint(img)
+    if baseline_fingerprint is not None and \
+            fingerprint_distance(fingerprint, baseline_fingerprint) <= FINGERPRINT_TOLERANCE:
+        return VisualResult(fingerprint, True, False, 0.0)
+
+    write_blob(blob_path, png, img)
+    previous = cv2.imread(baseline_path, cv2.IMREAD_COLOR) if baseline_path else None
+    if previous is None:
+        return VisualResult(fingerprint, False, False, 0.0)
+
+    try:
+        # Resize images to same dimensions if needed
+        if previous.shape != img.shape:
+            h, w = min(previous.shape[0], img.shape[0]), min(previous.shape[1], img.shape[1])
+            previous = cv2.resize(previous, (w, h))
+            img = cv2.resize(img, (w, h))
+        # Significant change means more than 5% of pixels changed
+        has_change, percentage, highlighted = diff_images(previous, img, threshold_percent=5.0)
+        if highlighted is not None:
+            cv2.imwrite(diff_path, highlighted)
+        return VisualResult(fingerprint, False, has_change, percentage)
+    except Exception as e:
+        print(f"Error comparing screenshots: {e}")
+        return VisualResult(fingerprint, False, False, 0.0)
+
+
+def _visual_check_shared(shm_name: str, size: int, *args) -> Optional[VisualResult]:
+    """visual_check on a screenshot in a shared memory block; runs in a worker process."""
+    shm = SharedMemory(name=shm_name)
+    view = shm.buf[:size]
+    try:
+        return visual_check(view, *args)
+    finally:
+        view.release()
+        shm.close()
+
+
+class DiffPool:
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        max_workers: worker processes; defaults to the number of cores.
+        0 runs every check in the calling thread.
+        """
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max(0, max_workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Started on first use; spawned rather than forked, since the monitor
+        # process runs the browser's event loop thread
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def submit(self, png: bytes, blob_path: str, baseline_path: Optional[str],
+               baseline_fingerprint: Optional[str], diff_path: str) -> 'Future[Optional[VisualResult]]':
+        """Start a visual_check; the returned future resolves to its result."""
+        args = (blob_path, baseline_path, baseline_fingerprint, diff_path)
+        if not self.max_workers:
+            future: Future = Future()
+            future.set_result(visual_check(png, *args))
+            return future
+
+        shm = SharedMemory(create=True, size=max(1, len(png)))
+        shm.buf[:len(png)] = png
+        try:
+            future = self._get_executor().submit(_visual_check_shared, shm.name, len(png), *args)
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+
+        def release(_future) -> None:
+            shm.close()
+            shm.unlink()
+
+        future.add_done_callback(release)
+        return future
+
+    def check(self, png: bytes, blob_path: str, baseline_path: Optional[str],
+              baseline_fingerprint: Optional[str], diff_path: str) -> Optional[VisualResult]:
+        """Run a visual_check on the pool and wait for it."""
+        args = (blob_path, baseline_path, baseline_fingerprint, diff_path)
+        try:
+            return self.submit(png, *args).result()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            print(f"Diff worker failed ({e}); comparing in-process")
+            with self._lock:
+                self._executor = None
+            return visual_check(png, *args)
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
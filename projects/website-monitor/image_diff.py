@@ -0,0 +1,128 @@
+"""
+Tiled screenshot diff engine.
+
+Both images are split into horizontal bands that are hashed and skipped when
+identical; differing bands are split into tiles and only differing tiles get
+the threshold, morphology and contour work. Processing stops as soon as the
+remaining tiles can no longer make the change significant, so an unchanged
+page costs little more than hashing both images. A significant change is
+always counted in full, since its percentage goes into the alert.
+"""
+
+import zlib
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+TILE_SIZE = 128
+
+# Gray-level difference treated as a real change (ignores anti-aliasing, font rendering)
+PIXEL_THRESHOLD = 80
+
+# Contours smaller than this (in pixels) are not highlighted
+MIN_CONTOUR_AREA = 1000
+
+# Context added around a tile so morphology at tile edges matches a full-image pass
+_PAD = 2
+
+_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+
+def band_hashes(img: np.ndarray, tile_size: int = TILE_SIZE) -> List[Tuple[int, int]]:
+    """
+    Hash each full-width band of tile_size rows.
+    crc32 and adler32 together give a 64-bit check at memory bandwidth,
+    several times faster than a cryptographic hash.
+    """
+    img = np.ascontiguousarray(img)
+    hashes = []
+    for y in range(0, img.shape[0], tile_size):
+        band = img[y:y + tile_size]
+        hashes.append((zlib.crc32(band), zlib.adler32(band)))
+    return hashes
+
+
+def changed_tiles(img1: np.ndarray, img2: np.ndarray,
+                  tile_size: int = TILE_SIZE) -> List[Tuple[int, int, int, int]]:
+    """Return (y0, y1, x0, x1) of every tile that is not byte-identical."""
+    height, width = img1.shape[:2]
+    tiles = []
+    for band, (hash1, hash2) in enumerate(zip(band_hashes(img1, tile_size), band_hashes(img2, tile_size))):
+        if hash1 == hash2:
+            continue
+        y0 = band * tile_size
+        y1 = min(y0 + tile_size, height)
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            if not np.array_equal(img1[y0:y1, x0:x1], img2[y0:y1, x0:x1]):
+                tiles.append((y0, y1, x0, x1))
+    return tiles
+
+
+def _tile_mask(img1: np.ndarray, img2: np.ndarray, tile: Tuple[int, int, int, int]) -> np.ndarray:
+    """Thresholded, noise-filtered change mask for one tile."""
+    y0, y1, x0, x1 = tile
+    height, width = img1.shape[:2]
+    py0, py1 = max(0, y0 - _PAD), min(height, y1 + _PAD)
+    px0, px1 = max(0, x0 - _PAD), min(width, x1 + _PAD)
+
+    diff = cv2.absdiff(img1[py0:py1, px0:px1], img2[py0:py1, px0:px1])
+    gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray_diff, PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY)
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, _KERNEL)
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, _KERNEL)
+    return thresh[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+
+
+def diff_images(img1: np.ndarray, img2: np.ndarray, threshold_percent: float = 5.0,
+                tile_size: int = TILE_SIZE) -> Tuple[bool, float, Optional[np.ndarray]]:
+    """
+    Compare two same-sized BGR images.
+    Returns (has_significant_change, change_percentage, highlighted_image).
+
+    A significant change is counted over every differing tile. When the change
+    is known to stay under the threshold before every tile is processed, the
+    percentage only counts the processed tiles (none when every differing
+    tile together stays under the threshold). highlighted_image is None
+    unless the change is significant.
+    """
+    height, width = img1.shape[:2]
+    total_pixels = height * width
+    if total_pixels == 0:
+        return False, 0.0, None
+    limit = total_pixels * threshold_percent / 100
+
+    tiles = changed_tiles(img1, img2, tile_size)
+    remaining = sum((y1 - y0) * (x1 - x0) for y0, y1, x0, x1 in tiles)
+    if remaining <= limit:
+        # Even if every differing pixel counted, the change can't be significant
+        return False, 0.0, None
+
+    mask = np.zeros((height, width), dtype=np.uint8)
+    changed_pixels = 0
+    for tile in tiles:
+        y0, y1, x0, x1 = tile
+        tile_mask = _tile_mask(img1, img2, tile)
+        mask[y0:y1, x0:x1] = tile_mask
+        changed_pixels += cv2.countNonZero(tile_mask)
+        remaining -= (y1 - y0) * (x1 - x0)
+
+        # Past the threshold the rest is still counted, so the reported percentage is the whole change
+        if changed_pixels <= limit and changed_pixels + remaining <= limit:
+            break
+
+    change_percentage = (changed_pixels / total_pixels) * 100
+    significant = changed_pixels > limit
+    if not significant:
+        return False, change_percentage, None
+
+    # Draw rectangles around changed areas (only significant ones)
+    highlighted = img2.copy()
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours:
+        if cv2.contourArea(contour) > MIN_CONTOUR_AREA:
+            x, y, w, h = cv2.boundingRect(contour)
+            cv2.rectangle(highlighted, (x, y), (x + w, y + h), (0, 0, 255), 3)
+
+    return True, change_percentage, highlighted
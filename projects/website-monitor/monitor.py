@@ -3,17 +3,15 @@ Website Monitor - Detects changes on web pages and sends notifications
 with visual comparison using screenshots and highlighted differences.
 """
 
-import requests
 from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
-import cv2
-import numpy as np
 from PIL import Image, ImageDraw, ImageFont
+import argparse
 import os
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable
 
 # Load environment variables from .env file
 try:
@@ -25,18 +23,63 @@ except ImportError:
 # Add shared modules to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from notifications import send_notification
-from utils import has_content_changed, ensure_directory_exists
+from notifications import queue_notification, flush_notifications
+import metrics
+from metrics import RunMetrics
+from sharding import ShardWorker, add_shard_arguments, worker_from_args
+from polling import AdaptivePolicy, PollState
+from utils import calculate_hash, ensure_directory_exists
+from fingerprints import FingerprintStore
+import http_client
+from fetch_engine import host_of
+from resilience import CircuitOpenError
+from browser_pool import BrowserPool
+from diff_pool import DiffPool
+from baselines import BaselineStore, DEFAULT_RETENTION, content_digest
+from content_filter import ContentFilter, extract_selectors
+
+# Region name of a full-page screenshot
+FULL_PAGE = 'full_page'
 
 
 class WebsiteMonitor:
-    def __init__(self, config_file: str = "config.json"):
-        """Initialize the website monitor with configuration."""
-        self.config = self.load_config(config_file)
-        self.screenshots_dir = "screenshots"
-        self.data_dir = "data"
+    def __init__(self, config_file: str = "config.json", base_dir: Optional[str] = None):
+        """
+        Initialize the website monitor with configuration.
+        base_dir: directory holding config, screenshots and data; defaults to the working directory.
+        """
+        base_dir = base_dir or ""
+        self.config_file = os.path.join(base_dir, config_file)
+        self.config = self.load_config(self.config_file)
+        self.screenshots_dir = os.path.join(base_dir, "screenshots")
+        self.data_dir = os.path.join(base_dir, "data")
         ensure_directory_exists(self.screenshots_dir)
         ensure_directory_exists(self.data_dir)
+        # Committed baselines: content-addressed, written only when a page visibly changes
+        self.baselines = BaselineStore(os.path.join(base_dir, "baselines"),
+                                       retention=self.config.get('baseline_retention', DEFAULT_RETENTION))
+        # Screenshots for different websites run concurrently on one browser
+        self.max_concurrent_pages = self.config.get('max_concurrent_pages', 4)
+        self.browser_pool = BrowserPool(max_pages=self.max_concurrent_pages)
+        # Decoding and diffing run in worker processes, one per core unless
+        # "diff_workers" says otherwise (0 diffs in the monitor threads)
+        self.diff_pool = DiffPool(self.config.get('diff_workers'))
+        # Sites back off from min to max interval while they don't change and
+        # reset to the minimum when they do; off with "adaptive_polling": false
+        self.poll_state: Optional[PollState] = None
+        if self.config.get('adaptive_polling', True):
+            policy = AdaptivePolicy(self.config.get('min_interval_minutes', 360) * 60,
+                                    self.config.get('max_interval_minutes', 7 * 24 * 60) * 60)
+            # Rewritten by every check, so it lives outside the committed data/ directory
+            # (CI keeps it in a cache) and an unchanged page still causes no commit
+            poll_state_file = os.path.join(base_dir, ".cache", "poll_state.json")
+            legacy_path = os.path.join(self.data_dir, "poll_state.json")
+            if os.path.exists(legacy_path) and not os.path.exists(poll_state_file):
+                ensure_directory_exists(os.path.dirname(poll_state_file))
+                os.replace(legacy_path, poll_state_file)
+            self.poll_state = PollState(poll_state_file, policy)
+        # Set by sharded runs: alert_once(key) is False for alerts another worker already sent
+        self.alert_once: Optional[Callable[[str], bool]] = None
     
     def load_config(self, config_file: str) -> Dict[str, Any]:
         """Load configuration from JSON file."""
@@ -63,166 +106,363 @@ class WebsiteMonitor:
                 json.dump(default_config, f, indent=2)
             return default_config
     
-    def take_screenshot(self, url: str, output_path: str, full_page: bool = True) -> bool:
-        """Take a screenshot of the webpage using Playwright."""
+    def load_page(self, page, url: str) -> None:
+        """
+        Navigate a browser page to url. Failed loads count against the host's
+        circuit breaker, like failed HTTP requests, and an open breaker skips the load.
+        """
+        host = host_of(url)
+        http_client.breakers.check(host)
         try:
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=True)
-                page = browser.new_page()
+            with metrics.stage('page_load'):
                 page.goto(url)
-                page.wait_for_load_state('networkidle')
-                page.screenshot(path=output_path, full_page=full_page)
-                browser.close()
-            return True
+        except Exception:
+            http_client.breakers.failure(host)
+            raise
+        http_client.breakers.success(host)
+    
+    def capture_page(self, url: str, selectors: Optional[Dict[str, str]] = None,
+                     full_page: bool = True, ignore_selectors: Optional[List[str]] = None,
+                     screenshot_if: Optional[Callable[[Dict[str, str]], bool]] = None,
+                     regions: Optional[Dict[str, str]] = None
+                     ) -> tuple[Optional[Dict[str, bytes]], Dict[str, str]]:
+        """
+        Load the page once in the browser and take both the screenshots and the rendered DOM.
+        screenshot_if is called with the extracted content and decides whether the
+        screenshots are taken at all. Screenshots stay in memory.
+        Returns ({region: PNG bytes} or None, content); see screenshot_regions
+        """
+        try:
+            with self.browser_pool.page() as page:
+                self.load_page(page, url)
+                with metrics.stage('extract'):
+                    content = self.extract_content(page.content(), selectors, ignore_selectors)
+                if screenshot_if is not None and not screenshot_if(content):
+                    return None, content
+                screenshots = self.screenshot_regions(page, regions, full_page)
+            return screenshots, content
+        except Exception as e:
+            print(f"Error capturing page: {e}")
+            return None, {}
+    
+    def take_screenshots(self, url: str, regions: Optional[Dict[str, str]] = None,
+                         full_page: bool = True) -> Optional[Dict[str, bytes]]:
+        """Load a page and screenshot its regions; see screenshot_regions. None on failure."""
+        try:
+            with self.browser_pool.page() as page:
+                self.load_page(page, url)
+                return self.screenshot_regions(page, regions, full_page)
         except Exception as e:
             print(f"Error taking screenshot: {e}")
-            return False
+            return None
+    
+    def screenshot_regions(self, page, regions: Optional[Dict[str, str]], full_page: bool = True) -> Dict[str, bytes]:
+        """
+        Screenshot the bounding box of each region's element, as {region: PNG bytes}.
+        Without regions, or when one of their elements is missing, the whole page
+        is captured instead, as {FULL_PAGE: PNG bytes}.
+        """
+        with metrics.stage('screenshot'):
+            screenshots = page.screenshot_elements(regions) if regions else None
+            if screenshots is None:
+                if regions:
+                    print("Region not found on the page, comparing the full page instead")
+                screenshots = {FULL_PAGE: page.screenshot(full_page=full_page)}
+            metrics.add_bytes(sum(len(png) for png in screenshots.values()))
+        return screenshots
+    
+    @staticmethod
+    def visual_regions(website_config: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        """
+        The selectors whose elements are screenshotted and diffed on their own:
+        "visual_regions" names some of the site's selectors, or is true for all of them.
+        None means the full page.
+        """
+        names = website_config.get('visual_regions')
+        selectors = website_config.get('selectors', {})
+        if names is True:
+            names = list(selectors)
+        if not names:
+            return None
+        missing = [region for region in names if region not in selectors]
+        if missing:
+            print(f"Unknown visual regions for {website_config['name']}: {', '.join(missing)}")
+        regions = {region: selectors[region] for region in names if region in selectors}
+        return regions or None
+    
+    @staticmethod
+    def baseline_key(name: str, region: str) -> str:
+        """The baseline store key of a website region; the full page uses the website name."""
+        return name if region == FULL_PAGE else f"{name}#{region}"
+    
+    def diff_path(self, name: str, region: str) -> str:
+        """Where the highlighted diff of a website region is written."""
+        suffix = '' if region == FULL_PAGE else f"_{region}"
+        return os.path.join(self.screenshots_dir, f"{name}{suffix}_diff.png")
+    
+    def baseline_keys(self, website_config: Dict[str, Any]) -> List[str]:
+        """Every baseline a website may have: its regions' and the full-page fallback."""
+        name = website_config['name']
+        regions = self.visual_regions(website_config) or {}
+        return [name] + [self.baseline_key(name, region) for region in regions]
+    
+    def retain_baselines(self, websites: List[Dict[str, Any]]) -> None:
+        """Drop the baselines of websites and regions that were removed from the config."""
+        self.baselines.retain(key for website in websites for key in self.baseline_keys(website))
+    
+    def check_visual(self, name: str, png: bytes, diff_path: str) -> tuple[bool, float]:
+        """
+        Compare a screenshot with the website's baseline and make it the new
+        baseline if it visibly differs. Identical bytes or a matching perceptual
+        fingerprint end the check without decoding the baseline or writing anything.
+        Returns (has_significant_change, difference_percentage)
+        """
+        digest = content_digest(png)
+        baseline = self.baselines.current(name)
+        if baseline is not None and baseline['sha256'] == digest:
+            print("Screenshot identical to the baseline")
+            return False, 0.0
+        
+        # Decode, fingerprint and diff on the diff pool; this thread holds no browser page meanwhile
+        with metrics.stage('diff'):
+            result = self.diff_pool.check(
+                png,
+                blob_path=self.baselines.blob_path(digest),
+                baseline_path=self.baselines.blob_path(baseline['sha256']) if baseline else None,
+                baseline_fingerprint=baseline['fingerprint'] if baseline else None,
+                diff_path=diff_path,
+            )
+        if result is None:
+            print(f"Screenshot of {name} could not be decoded")
+            return False, 0.0
+        if baseline is None:
+            print("No previous screenshot found for comparison")
+        elif result.matched:
+            # Rendering noise only; keep the old baseline so slow drift still adds up
+            print("Screenshot matches the baseline fingerprint")
+            return False, 0.0
+        
+        # The diff worker already stored the blob; only the index changes here
+        with metrics.stage('baseline_write'):
+            self.baselines.update(name, png, digest=digest, fingerprint=result.fingerprint)
+        return result.has_change, result.percentage
+    
+    def migrate_legacy_baseline(self, name: str) -> None:
+        """Move a screenshots/<name>_previous.png baseline into the baseline store."""
+        legacy_path = os.path.join(self.screenshots_dir, f"{name}_previous.png")
+        if not os.path.exists(legacy_path):
+            return
+        if self.baselines.current(name) is None:
+            with open(legacy_path, 'rb') as f:
+                self.baselines.update(name, f.read())
+        os.remove(legacy_path)
+    
+    def load_state(self, state_file: str) -> Dict[str, Any]:
+        """Load the per-site check state (HTTP validators, forced-visual counter)."""
+        try:
+            with open(state_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def save_state(self, state_file: str, state: Dict[str, Any]) -> None:
+        with open(state_file, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
     
-    def compare_screenshots(self, img1_path: str, img2_path: str, diff_path: str) -> tuple[bool, float]:
+    def conditional_fetch(self, url: str, state: Dict[str, Any]):
         """
-        Compare two screenshots and create a diff image highlighting changes.
-        Returns (has_differences, difference_percentage)
+        GET the page with the stored ETag/Last-Modified validators.
+        Returns the response (304 when unchanged) or None if the request failed.
+        New validators from a 200 response are written into state.
         """
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
         try:
-            # Load images
-            img1 = cv2.imread(img1_path)
-            img2 = cv2.imread(img2_path)
-            
-            if img1 is None or img2 is None:
-                return False, 0.0
-            
-            # Resize images to same dimensions if needed
-            if img1.shape != img2.shape:
-                h, w = min(img1.shape[0], img2.shape[0]), min(img1.shape[1], img2.shape[1])
-                img1 = cv2.resize(img1, (w, h))
-                img2 = cv2.resize(img2, (w, h))
-            
-            # Calculate difference
-            diff = cv2.absdiff(img1, img2)
-            gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-            
-            # Use a higher threshold to ignore minor differences (anti-aliasing, font rendering)
-            _, thresh = cv2.threshold(gray_diff, 80, 255, cv2.THRESH_BINARY)  # Increased from 50 to 80
-            
-            # Apply morphological operations to reduce noise
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-            thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-            thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-            
-            # Calculate percentage of changed pixels
-            total_pixels = thresh.shape[0] * thresh.shape[1]
-            changed_pixels = cv2.countNonZero(thresh)
-            change_percentage = (changed_pixels / total_pixels) * 100
-            
-            # Create highlighted diff image
-            highlighted = img2.copy()
-            
-            # Find contours of changed areas
-            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            # Draw rectangles around changed areas (only significant ones)
-            for contour in contours:
-                if cv2.contourArea(contour) > 1000:  # Increased from 500 to filter even smaller changes
-                    x, y, w, h = cv2.boundingRect(contour)
-                    cv2.rectangle(highlighted, (x, y), (x + w, y + h), (0, 0, 255), 3)
-            
-            # Save the highlighted diff image
-            cv2.imwrite(diff_path, highlighted)
-            
-            # Consider significant change if more than 5% of pixels changed (increased from 2.0%)
-            has_significant_change = change_percentage > 5.0
-            
-            return has_significant_change, change_percentage
-            
+            with metrics.stage('conditional_fetch'):
+                response = http_client.get(url, headers=headers)
         except Exception as e:
-            print(f"Error comparing screenshots: {e}")
-            return False, 0.0
+            print(f"Error fetching {url}: {e}")
+            return None
+        if response.status_code == 200:
+            state['etag'] = response.headers.get('ETag')
+            state['last_modified'] = response.headers.get('Last-Modified')
+        return response
     
-    def get_page_content(self, url: str, selectors: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    def get_page_content(self, url: str, selectors: Optional[Dict[str, str]] = None,
+                         ignore_selectors: Optional[List[str]] = None) -> Dict[str, str]:
         """Extract content from webpage using specified selectors."""
         try:
-            response = requests.get(url, timeout=30)
+            with metrics.stage('fetch'):
+                response = http_client.get(url)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove dynamic elements that change frequently
-            for element in soup.find_all(['script', 'style', 'noscript']):
-                element.decompose()
-            
-            # Remove elements with common dynamic classes/ids
-            dynamic_selectors = [
-                '[id*="timestamp"]', '[class*="timestamp"]',
-                '[id*="session"]', '[class*="session"]', 
-                '[id*="random"]', '[class*="random"]',
-                '[class*="ad"]', '[id*="ad"]',
-                '.cookie-banner', '.cookie-notice',
-                '[data-timestamp]', '[data-session]'
-            ]
-            
-            for selector in dynamic_selectors:
-                for element in soup.select(selector):
-                    element.decompose()
-            
-            content = {}
-            
-            if selectors:
-                for name, selector in selectors.items():
-                    elements = soup.select(selector)
-                    if elements:
-                        content[name] = '\n'.join(element.get_text(strip=True) for element in elements)
-                    else:
-                        content[name] = ""
-            else:
-                # Default: get all text content
-                content['full_page'] = soup.get_text(strip=True)
-            
-            return content
+            with metrics.stage('extract'):
+                return self.extract_content(response.content, selectors, ignore_selectors)
             
         except Exception as e:
             print(f"Error fetching page content: {e}")
             return {}
     
+    def extract_content(self, html, selectors: Optional[Dict[str, str]] = None,
+                        ignore_selectors: Optional[List[str]] = None) -> Dict[str, str]:
+        """Extract content from an HTML document using specified selectors."""
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Remove scripts, styles and dynamic elements that change frequently,
+        # plus the site's own ignore rules, in one pass over the tree
+        ContentFilter(ignore_selectors).strip(soup)
+        
+        if selectors:
+            return extract_selectors(soup, selectors)
+        
+        # Default: get all text content
+        return {'full_page': soup.get_text('\n', strip=True)}
+    
     def monitor_website(self, website_config: Dict[str, Any]) -> bool:
         """Monitor a single website for changes."""
+        with metrics.target(website_config['name'], url=website_config['url']):
+            success = self._check_website(website_config)
+            if not success:
+                metrics.fail("check failed")
+            return success
+    
+    def _check_website(self, website_config: Dict[str, Any]) -> bool:
         name = website_config['name']
         url = website_config['url']
         selectors = website_config.get('selectors', {})
+        ignore_selectors = website_config.get('ignore_selectors', [])
+        # With "visual_regions", only those selectors' elements are screenshotted and diffed
+        regions = self.visual_regions(website_config)
         
         print(f"Monitoring {name} at {url}")
         
-        # File paths
+        # A site that kept failing is skipped until its circuit breaker's cool-down is over
+        try:
+            http_client.check_circuit(url)
+        except CircuitOpenError as e:
+            print(f"Skipping {name}: {e}")
+            return False
+        
+        # File paths; screenshots/ only holds images attached to notifications,
+        # the baseline itself lives in the baseline store
         current_screenshot = os.path.join(self.screenshots_dir, f"{name}_current.png")
-        previous_screenshot = os.path.join(self.screenshots_dir, f"{name}_previous.png")
-        diff_screenshot = os.path.join(self.screenshots_dir, f"{name}_diff.png")
-        content_hash_file = os.path.join(self.data_dir, f"{name}_content.hash")
+        fingerprint_file = os.path.join(self.data_dir, f"{name}_fingerprints.json")
+        state_file = os.path.join(self.data_dir, f"{name}_state.json")
         
-        # Get current content
-        current_content = self.get_page_content(url, selectors)
-        if not current_content:
-            print(f"Failed to get content from {url}")
-            return False
+        # "browser" renders the page once for both screenshot and content, so the
+        # content hash matches what the screenshot shows on JavaScript pages.
+        # "http" fetches the content with a plain request and screenshots separately.
+        capture_mode = website_config.get('capture_mode', 'browser')
+        
+        # Checks run cheapest first and stop as soon as one says nothing changed:
+        # 1. conditional request with the stored ETag/Last-Modified (304 ends the check)
+        # 2. per-selector content hashes
+        # 3. screenshot and visual diff, only when tier 2 saw a change or every
+        #    force_visual_every runs (0 disables the forced runs)
+        state = self.load_state(state_file)
+        saved_state = dict(state)
+        tiers = {}
+        force_every = website_config.get('force_visual_every', self.config.get('force_visual_every', 0))
+        runs_since_visual = state.get('runs_since_visual', 0) + 1
+        self.migrate_legacy_baseline(name)
+        # When the regions' elements were missing last time, the full page was compared
+        # instead and its baseline is the one to expect
+        baseline_keys = [self.baseline_key(name, region) for region in regions] \
+            if regions and not state.get('region_fallback') else [name]
+        force_visual = any(self.baselines.current(key) is None for key in baseline_keys) or bool(
+            force_every and runs_since_visual >= force_every
+        )
         
-        # Check for content changes
-        content_str = json.dumps(current_content, sort_keys=True)
-        content_changed, _ = has_content_changed(content_str, content_hash_file)
+        def finish_state(screenshot_taken: bool) -> None:
+            # The counter is only kept when forced visual checks are on, and the
+            # tier outcomes go to the run metrics, so an unchanged page writes nothing
+            if force_every:
+                state['runs_since_visual'] = 0 if screenshot_taken else runs_since_visual
+            else:
+                state.pop('runs_since_visual', None)
+            state.pop('last_check', None)
+            metrics.label('tiers', tiers)
+            if state != saved_state:
+                self.save_state(state_file, state)
         
-        # Take current screenshot
-        screenshot_success = self.take_screenshot(url, current_screenshot)
+        # Tier 1: conditional request. A site whose last full response had no ETag or
+        # Last-Modified can't answer 304, so the request would only download the page
+        # a second time; it is skipped until the next forced visual check asks again
+        sends_validators = 'etag' not in state or bool(state.get('etag') or state.get('last_modified'))
+        response = self.conditional_fetch(url, state) if sends_validators or force_visual else None
+        if not (sends_validators or force_visual):
+            tiers['conditional'] = 'no_validators'
+        elif response is None:
+            tiers['conditional'] = 'error'
+        elif response.status_code == 304:
+            tiers['conditional'] = 'not_modified'
+            if not force_visual:
+                print(f"{name} not modified since last check (HTTP 304)")
+                finish_state(False)
+                self.record_poll(website_config, False)
+                return True
+        else:
+            tiers['conditional'] = 'modified'
         
-        visual_change_detected = False
-        change_percentage = 0.0
+        # Tier 2: per-selector content fingerprints
+        content_changed = False
+        content_diffs: Dict[str, List[str]] = {}
         
-        # Compare screenshots if previous exists
-        if screenshot_success and os.path.exists(previous_screenshot):
-            visual_change_detected, change_percentage = self.compare_screenshots(
-                previous_screenshot, current_screenshot, diff_screenshot
+        def check_content(content: Dict[str, str]) -> bool:
+            """Record content changes; returns whether the visual tier should run."""
+            nonlocal content_changed, content_diffs
+            if not content:
+                return False
+            with metrics.stage('fingerprint'):
+                fingerprints = FingerprintStore(fingerprint_file)
+                content_diffs = fingerprints.update(content) or {}
+                fingerprints.save()
+            content_changed = bool(content_diffs)
+            tiers['content'] = f"changed: {', '.join(content_diffs)}" if content_changed else 'unchanged'
+            return content_changed or force_visual
+        
+        # Get current content
+        if capture_mode == 'browser':
+            screenshots, current_content = self.capture_page(
+                url, selectors, ignore_selectors=ignore_selectors, screenshot_if=check_content, regions=regions
             )
-            print(f"Visual comparison: {change_percentage:.2f}% change detected (threshold: 5.0%)")
         else:
-            print("No previous screenshot found for comparison")
+            if response is not None and response.status_code == 200:
+                with metrics.stage('extract'):
+                    current_content = self.extract_content(response.content, selectors, ignore_selectors)
+            else:
+                current_content = self.get_page_content(url, selectors, ignore_selectors)
+            # Tier 3 (http mode): separate screenshot only when needed
+            screenshots = self.take_screenshots(url, regions) if check_content(current_content) else None
+        if not current_content:
+            print(f"Failed to get content from {url}")
+            return False
+        
+        # Compare each region with its own baseline; a baseline is replaced only when it visibly changed
+        visual_results: Dict[str, tuple[bool, float]] = {}
+        for region, png in (screenshots or {}).items():
+            visual_results[region] = self.check_visual(self.baseline_key(name, region), png,
+                                                       self.diff_path(name, region))
+            label = 'Visual comparison' if region == FULL_PAGE else f"Visual comparison ({region})"
+            print(f"{label}: {visual_results[region][1]:.2f}% change detected (threshold: 5.0%)")
+        if not screenshots:
+            print("Content unchanged, skipped screenshot and visual comparison")
+        elif regions and FULL_PAGE in screenshots:
+            state['region_fallback'] = True
+        else:
+            state.pop('region_fallback', None)
+        changed_regions = {region: percentage for region, (changed, percentage) in visual_results.items() if changed}
+        visual_change_detected = bool(changed_regions)
+        change_percentage = max((percentage for _, percentage in visual_results.values()), default=0.0)
+        tiers['visual'] = {region: f"{percentage:.2f}%" for region, (_, percentage) in visual_results.items()} \
+            if screenshots else 'skipped'
+        finish_state(bool(screenshots))
+        
         # Determine if notification should be sent
         should_notify = content_changed or visual_change_detected
+        self.record_poll(website_config, should_notify)
         
         if should_notify:
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -230,9 +470,12 @@ class WebsiteMonitor:
             # Prepare notification message
             changes = []
             if content_changed:
-                changes.append("content changes detected")
-            if visual_change_detected:
+                changes.append(f"content changes detected ({', '.join(content_diffs)})")
+            if FULL_PAGE in changed_regions:
                 changes.append(f"visual changes detected ({change_percentage:.2f}% of page changed)")
+            elif visual_change_detected:
+                changes.append("visual changes detected (" + ', '.join(
+                    f"{region}: {percentage:.2f}% changed" for region, percentage in changed_regions.items()) + ")")
             
             message = f"""
 🔄 Website Change Detected: {name}
@@ -244,54 +487,129 @@ Changes: {', '.join(changes)}
 Please check the attached screenshot for highlighted differences.
             """.strip()
             
-            # Send Discord notification
-            success = send_notification(
-                message=message,
-                webhook_url=self.config.get('discord_webhook') or os.getenv('DISCORD_WEBHOOK'),
-                image_path=diff_screenshot if visual_change_detected else current_screenshot
-            )
-            
-            print(f"Change detected for {name}. Notification sent: {success}")
+            # What changed, per selector
+            for selector_name, diff_lines in content_diffs.items():
+                if diff_lines:
+                    message += f"\n\n**{selector_name}**\n```diff\n" + '\n'.join(diff_lines) + "\n```"
             
-            # Create notification flag file for GitHub Actions
-            if success:
-                notification_flag = os.path.join(self.screenshots_dir, f"{name}_notification_sent.flag")
-                with open(notification_flag, 'w') as f:
-                    f.write(f"Notification sent at {timestamp}\n")
-                    f.write(f"Image used: {diff_screenshot if visual_change_detected else current_screenshot}\n")
-                    f.write(f"Change percentage: {change_percentage:.2f}%\n")
+            if visual_change_detected:
+                # The diff of the region that changed most
+                image_path = self.diff_path(name, max(changed_regions, key=changed_regions.get))
+            elif screenshots:
+                image_path = current_screenshot
+                with open(current_screenshot, 'wb') as f:
+                    f.write(next(iter(screenshots.values())))
+            else:
+                image_path = None
             
-            # Move current screenshot to previous for next comparison
-            if screenshot_success and os.path.exists(current_screenshot):
-                if os.path.exists(previous_screenshot):
-                    os.remove(previous_screenshot)
-                os.rename(current_screenshot, previous_screenshot)
+            # Sharded workers skip changes another worker already alerted in this run
+            alert_key = f"website:{name}:" + calculate_hash(
+                json.dumps(content_diffs, sort_keys=True) + str(visual_change_detected)
+            )
+            if self.alert_once is not None and not self.alert_once(alert_key):
+                print(f"Change for {name} was already alerted by another worker")
+                success = True
+            else:
+                # Queue the Discord notification; it is sent in the background while the scan continues
+                notification = queue_notification(
+                    message=message,
+                    webhook_url=self.config.get('discord_webhook') or os.getenv('DISCORD_WEBHOOK'),
+                    image_path=image_path
+                )
+                
+                print(f"Change detected for {name}. Notification queued")
+                
+                def write_flag(future) -> None:
+                    # Create notification flag file for GitHub Actions once Discord accepted it
+                    if not future.result():
+                        print(f"Notification for {name} was not sent")
+                        return
+                    notification_flag = os.path.join(self.screenshots_dir, f"{name}_notification_sent.flag")
+                    with open(notification_flag, 'w') as f:
+                        f.write(f"Notification sent at {timestamp}\n")
+                        f.write(f"Image used: {image_path}\n")
+                        f.write(f"Change percentage: {change_percentage:.2f}%\n")
+                
+                notification.add_done_callback(write_flag)
+                success = not notification.done() or notification.result()
             
             return success
         else:
             print(f"No changes detected for {name}")
-            
-            # Move current screenshot to previous for next comparison
-            if screenshot_success and os.path.exists(current_screenshot):
-                if os.path.exists(previous_screenshot):
-                    os.remove(previous_screenshot)
-                os.rename(current_screenshot, previous_screenshot)
-            
             return True
     
-    def run(self):
-        """Run monitoring for all configured websites."""
+    @property
+    def check_threads(self) -> int:
+        """
+        Threads for concurrent website checks: enough to keep every browser page
+        busy while other checks wait on the diff pool.
+        """
+        return self.max_concurrent_pages + self.diff_pool.max_workers
+    
+    def record_poll(self, website_config: Dict[str, Any], changed: bool) -> None:
+        """Feed a check outcome to the adaptive poll state."""
+        if self.poll_state is None:
+            return
+        base = website_config.get('interval_minutes', self.config.get('check_interval_minutes'))
+        self.poll_state.record(website_config['name'], changed, base=base * 60 if base else None)
+        self.poll_state.save()
+    
+    def due_websites(self) -> List[Dict[str, Any]]:
+        """Configured websites, minus those the adaptive poll state says aren't due yet."""
+        websites = self.config['websites']
+        if self.poll_state is None:
+            return websites
+        due = [website for website in websites if self.poll_state.is_due(website['name'])]
+        if len(due) < len(websites):
+            print(f"Skipped {len(websites) - len(due)} websites that are not due yet")
+        return due
+    
+    def run(self, worker: Optional[ShardWorker] = None):
+        """
+        Run monitoring for all configured websites.
+        worker: a sharding.ShardWorker; only the websites of the shards it claims are checked.
+        """
         print(f"Starting website monitoring at {datetime.now()}")
         
-        for website in self.config['websites']:
+        def monitor(website: Dict[str, Any]) -> None:
             try:
                 self.monitor_website(website)
             except Exception as e:
                 print(f"Error monitoring {website.get('name', 'unknown')}: {e}")
         
+        # Drop baselines and poll state of websites that were removed from the config
+        names = [website['name'] for website in self.config['websites']]
+        self.retain_baselines(self.config['websites'])
+        if self.poll_state is not None:
+            self.poll_state.retain(names)
+            self.poll_state.save()
+        
+        # Stage timings go to METRICS_LOG / METRICS_TEXTFILE_DIR when set
+        with RunMetrics('website_monitor'):
+            try:
+                with ThreadPoolExecutor(max_workers=self.check_threads) as executor:
+                    websites = self.due_websites()
+                    if worker is None:
+                        list(executor.map(monitor, websites))
+                    else:
+                        self.alert_once = worker.alert_once
+                        for shard in worker.shards():
+                            print(f"Checking shard {shard + 1}/{worker.shard_count} as {worker.worker_id}")
+                            list(executor.map(monitor, [website for website in websites
+                                                        if worker.ring.shard_of_url(website['url']) == shard]))
+            finally:
+                self.browser_pool.close()
+                self.diff_pool.close()
+                # Make sure every queued alert (and its flag file) is out before exiting
+                flush_notifications()
+        
         print("Website monitoring completed")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the configured websites for changes.")
+    add_shard_arguments(parser)
+    args = parser.parse_args()
+    
     monitor = WebsiteMonitor()
-    monitor.run()
\ No newline at end of file
+    monitor.run(worker=worker_from_args(args, os.path.join(monitor.data_dir, 'shards.sqlite3')))
\ No newline at end of file
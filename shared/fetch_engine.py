@@ -0,0 +1,135 @@
+"""
+Bounded concurrent fetch engine.
+
+Runs blocking fetch jobs on a thread pool with a global concurrency cap,
+a per-host cap and a per-job timeout, yielding results in completion order.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+def host_of(url: str) -> str:
+    """Return the lower-cased host of a URL, used as the per-host cap key."""
+    return (urlsplit(url).hostname or "").lower()
+
+
+class FetchResult:
+    """Outcome of a single job: the original item plus its value or error."""
+
+    __slots__ = ("item", "value", "error", "elapsed")
+
+    def __init__(self, item: Any, value: Any = None, error: Optional[BaseException] = None,
+                 elapsed: float = 0.0):
+        self.item = item
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class FetchEngine:
+    def __init__(self, max_workers: int = 16, per_host_limit: int = 4,
+                 timeout: float = 60.0, max_pending: Optional[int] = None):
+        """
+        max_workers: global number of jobs in flight.
+        per_host_limit: jobs in flight against a single host.
+        timeout: seconds a job may run before it is reported as timed out.
+        max_pending: items read ahead from the input while waiting for a free
+            host slot; bounds memory when the input is a long stream.
+        """
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.max_pending = max_pending or max_workers * 8
+
+    def run(self, func: Callable[[Any], Any], items: Iterable[Any],
+            key: Callable[[Any], str] = host_of) -> Iterator[FetchResult]:
+        """
+        Apply func to every item and yield FetchResults as jobs finish.
+
+        key maps an item to its host. Items are read lazily, so the input can
+        be a generator of arbitrary length.
+        """
+        source = iter(items)
+        exhausted = False
+        waiting: Dict[str, Deque[Any]] = {}
+        pending_count = 0
+        in_flight: Dict[str, int] = {}
+        running: Dict[Any, Tuple[Any, str, float]] = {}
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            def start(item: Any, host: str) -> None:
+                in_flight[host] = in_flight.get(host, 0) + 1
+                future = pool.submit(func, item)
+                running[future] = (item, host, time.monotonic())
+
+            def release(host: str) -> None:
+                in_flight[host] -= 1
+                if not in_flight[host]:
+                    del in_flight[host]
+
+            def fill() -> None:
+                nonlocal exhausted, pending_count
+                # Start queued items whose host now has a free slot
+                for host in list(waiting):
+                    queue = waiting[host]
+                    while queue and len(running) < self.max_workers and \
+                            in_flight.get(host, 0) < self.per_host_limit:
+                        start(queue.popleft(), host)
+                        pending_count -= 1
+                    if not queue:
+                        del waiting[host]
+
+                # Pull new items from the source until workers or read-ahead run out
+                while not exhausted and len(running) < self.max_workers and \
+                        pending_count < self.max_pending:
+                    try:
+                        item = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    host = key(item)
+                    if host not in waiting and in_flight.get(host, 0) < self.per_host_limit:
+                        start(item, host)
+                    else:
+                        waiting.setdefault(host, deque()).append(item)
+                        pending_count += 1
+
+            fill()
+            while running:
+                now = time.monotonic()
+                next_deadline = min(started for _, _, started in running.values()) + self.timeout
+                done, _ = wait(list(running), timeout=max(0.0, next_deadline - now),
+                               return_when=FIRST_COMPLETED)
+
+                now = time.monotonic()
+                for future in done:
+                    item, host, started = running.pop(future)
+                    release(host)
+                    try:
+                        yield FetchResult(item, value=future.result(), elapsed=now - started)
+                    except Exception as e:
+                        yield FetchResult(item, error=e, elapsed=now - started)
+
+                # Report jobs that overran their timeout; the worker thread is left
+                # to finish on its own but its result is discarded.
+                for future, (item, host, started) in list(running.items()):
+                    if now - started >= self.timeout:
+                        del running[future]
+                        release(host)
+                        future.cancel()
+                        yield FetchResult(item, error=TimeoutError(
+                            f"Timed out after {self.timeout:.0f}s"), elapsed=now - started)
+
+                fill()
+        finally:
+            # Don't block on workers that overran their timeout
+            pool.shutdown(wait=False, cancel_futures=True)
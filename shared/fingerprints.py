@@ -0,0 +1,107 @@
+import base64
+import difflib
+import json
+import os
+import zlib
+from typing import Dict, List, Optional
+
+from utils import calculate_hash, ensure_directory_exists
+
+# Longest text kept per selector for diffing; the hash always covers the full text
+MAX_STORED_TEXT_BYTES = 64 * 1024
+
+# Diff lines kept per changed selector, and characters kept per line
+MAX_DIFF_LINES = 20
+MAX_DIFF_LINE_LENGTH = 200
+
+
+def _truncate(text: str) -> str:
+    """The part of text that is stored: at most MAX_STORED_TEXT_BYTES, cut at a line end."""
+    data = text.encode('utf-8')
+    if len(data) <= MAX_STORED_TEXT_BYTES:
+        return text
+    data = data[:MAX_STORED_TEXT_BYTES]
+    # Drop the partial last line, so a length change above the cut doesn't show up as a changed line
+    cut = data.rfind(b'\n')
+    return (data[:cut] if cut > 0 else data).decode('utf-8', errors='ignore')
+
+
+def _pack(text: str) -> str:
+    data = _truncate(text).encode('utf-8')
+    return base64.b64encode(zlib.compress(data, 9)).decode('ascii')
+
+
+def _unpack(packed: str) -> str:
+    return zlib.decompress(base64.b64decode(packed)).decode('utf-8', errors='ignore')
+
+
+def line_diff(old_text: str, new_text: str, max_lines: int = MAX_DIFF_LINES) -> List[str]:
+    """Added/removed lines between two texts, without context or headers."""
+    diff = difflib.unified_diff(old_text.splitlines(), new_text.splitlines(), lineterm='', n=0)
+    lines = [
+        line[:MAX_DIFF_LINE_LENGTH] for line in diff
+        if line[:1] in '+-' and not line.startswith(('+++', '---'))
+    ]
+    if len(lines) > max_lines:
+        lines = lines[:max_lines] + [f"... {len(lines) - max_lines} more changed lines"]
+    return lines
+
+
+class FingerprintStore:
+    """
+    Per-selector content fingerprints: a hash of each selector's text plus a
+    compressed, size-capped copy of the last text so changes can be diffed.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.entries: Dict[str, Dict[str, str]] = {}
+        self.dirty = False
+        try:
+            with open(file_path, 'r') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error loading fingerprints: {e}")
+
+    def update(self, content: Dict[str, str]) -> Optional[Dict[str, List[str]]]:
+        """
+        Compare content with the stored fingerprints and store the new ones.
+        Returns {selector_name: diff_lines} for selectors whose hash moved, or
+        None when there was nothing stored yet (first check is the baseline).
+        """
+        first_check = not self.entries
+        changes: Dict[str, List[str]] = {}
+
+        for name, text in content.items():
+            new_hash = calculate_hash(text)
+            entry = self.entries.get(name)
+            if entry is not None and entry['hash'] == new_hash:
+                continue
+
+            if entry is not None:
+                # Diff like for like: the stored copy is truncated, so the new text is too
+                stored = _truncate(text)
+                changes[name] = line_diff(_unpack(entry['text']), stored) or (
+                    [f"... changed after the first {MAX_STORED_TEXT_BYTES // 1024} KiB, which is all that is kept"]
+                    if stored != text else []
+                )
+            self.entries[name] = {'hash': new_hash, 'text': _pack(text)}
+            self.dirty = True
+
+        return None if first_check else changes
+
+    def save(self) -> bool:
+        """Write the store if anything changed."""
+        if not self.dirty:
+            return True
+        try:
+            ensure_directory_exists(os.path.dirname(self.file_path) or '.')
+            with open(self.file_path, 'w') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            self.dirty = False
+            return True
+        except OSError as e:
+            print(f"Error saving fingerprints: {e}")
+            return False
@@ -0,0 +1,161 @@
+"""
+Shared pooled HTTP client.
+
+One requests.Session per process with a per-host connection pool, default
+connect/read timeouts and gzip/brotli negotiation, so repeated requests to
+the same retailer reuse keep-alive connections instead of new TLS handshakes.
+
+Requests go through the per-host circuit breakers and retry policy of
+resilience.py: GETs are retried on connection errors and transient statuses,
+and a host whose breaker is open fails fast with CircuitOpenError.
+"""
+
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from fetch_engine import host_of
+from resilience import RETRY_STATUSES, CircuitBreakers, RetryBudget, RetryPolicy, retry_after
+
+# (connect, read) timeout in seconds applied when a caller doesn't pass one
+DEFAULT_TIMEOUT = (5, 30)
+
+# Methods that are safe to send twice
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Process-wide, so every caller of a host shares its breaker and all share one retry budget
+breakers = CircuitBreakers()
+retry_policy = RetryPolicy()
+retry_budget = RetryBudget()
+
+# Connection pools kept (one per host) and connections kept per host
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 16
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Connection": "keep-alive",
+}
+
+try:
+    # urllib3 decodes brotli transparently when a brotli package is installed
+    import brotli  # noqa: F401
+    DEFAULT_HEADERS["Accept-Encoding"] = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        DEFAULT_HEADERS["Accept-Encoding"] = "gzip, deflate, br"
+    except ImportError:
+        DEFAULT_HEADERS["Accept-Encoding"] = "gzip, deflate"
+
+
+class TimeoutSession(requests.Session):
+    """Session that applies DEFAULT_TIMEOUT to every request without one."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        return super().request(method, url, **kwargs)
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def create_session(timeout=DEFAULT_TIMEOUT, pool_connections: int = POOL_CONNECTIONS,
+                   pool_maxsize: int = POOL_MAXSIZE) -> requests.Session:
+    """Create a session with pooled adapters for http and https."""
+    session = TimeoutSession(timeout)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide shared session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def check_circuit(url: str) -> None:
+    """Raise CircuitOpenError if the url's host is cooling down after repeated failures."""
+    breakers.check(host_of(url))
+
+
+def request(method: str, url: str, retry: Optional[bool] = None, breaker: bool = True,
+            **kwargs) -> requests.Response:
+    """
+    Send a request through the shared session and the host's circuit breaker.
+    breaker=False keeps the request out of the breaker: it is neither blocked by an
+    open breaker nor counted towards opening one (for hosts that aren't scraped).
+    retry defaults to True for idempotent methods. Connection errors and
+    RETRY_STATUSES responses are retried with backoff (or after Retry-After)
+    while the retry budget allows; read timeouts are not, since a host that
+    didn't answer in time rarely answers on the next try.
+    Raises CircuitOpenError without sending anything while the host's breaker is open.
+    """
+    # Without a breaker every breakers call below is skipped
+    host = host_of(url) if breaker else None
+    if retry is None:
+        retry = method.upper() in IDEMPOTENT_METHODS
+    attempts = retry_policy.max_attempts if retry else 1
+    if host:
+        breakers.before(host)
+    retry_budget.deposit()
+    attempt = 0
+    while True:
+        last = attempt + 1 >= attempts
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except requests.ConnectionError:
+            if host:
+                breakers.failure(host)
+            if last or (host and breakers.is_open(host)) or not retry_budget.withdraw():
+                raise
+            delay = retry_policy.backoff(attempt)
+        except requests.Timeout:
+            if host:
+                breakers.failure(host)
+            raise
+        else:
+            metrics.record_response(response)
+            if host and response.status_code >= 500:
+                breakers.failure(host)
+            elif host:
+                breakers.success(host)
+            if response.status_code not in RETRY_STATUSES or last or (host and breakers.is_open(host)):
+                return response
+            delay = retry_after(response)
+            if delay is None:
+                delay = retry_policy.backoff(attempt)
+            # A Retry-After longer than the policy allows is handed back to the caller
+            if delay > retry_policy.max_delay or not retry_budget.withdraw():
+                return response
+            response.close()
+        attempt += 1
+        metrics.label('retries', attempt)
+        time.sleep(delay)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """GET through the shared session, with retries."""
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """POST through the shared session; not retried unless retry=True."""
+    return request("POST", url, **kwargs)
@@ -0,0 +1,364 @@
+"""
+Per-stage run metrics for the monitors.
+
+A run (one price tracker pass, one website monitor pass, one daemon cycle) is
+made of targets (a product URL, a website), and each target of stages (fetch,
+parse, screenshot, diff, ...). Every stage records its duration, the bytes it
+transferred and the last HTTP status it saw; every target records whether it
+succeeded. Stages recorded outside any target (the batched Power API call,
+Discord posts from the dispatcher thread) go to the run itself.
+
+    with RunMetrics('price_tracker'):
+        with metrics.target(url, company='rvrc'):
+            with metrics.stage('fetch'):
+                html = http_client.get(url).content   # status and bytes recorded
+
+Collection is a couple of perf_counter calls and dict updates per stage, and
+every helper is a no-op when no run is active. When the run ends the results
+are written to:
+
+    METRICS_LOG            JSON-lines run log, one line per target plus a summary line
+    METRICS_TEXTFILE_DIR   Prometheus textfile collector directory (<run>.prom)
+    PROFILE_TARGET         fnmatch pattern; matching targets run under cProfile, one at a
+                           time, and the stats are written to PROFILE_DIR (default:
+                           working directory)
+"""
+
+import cProfile
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from fnmatch import fnmatch
+from typing import Any, Dict, Optional, TextIO
+
+_active_run: Optional['RunMetrics'] = None
+# Set by RunMetrics.bind for a run that overlaps the process-wide one (e.g. the daemon's website pass)
+_context_run: contextvars.ContextVar = contextvars.ContextVar('metrics_run', default=None)
+_current_target: contextvars.ContextVar = contextvars.ContextVar('metrics_target', default=None)
+_current_stage: contextvars.ContextVar = contextvars.ContextVar('metrics_stage', default=None)
+
+
+def _new_stage() -> Dict[str, Any]:
+    return {'count': 0, 'seconds': 0.0, 'bytes': 0, 'status': None}
+
+
+def _add_stage(stages: Dict[str, Dict[str, Any]], name: str, stage: Dict[str, Any]) -> None:
+    total = stages.get(name)
+    if total is None:
+        total = stages[name] = _new_stage()
+    total['count'] += stage['count']
+    total['seconds'] += stage['seconds']
+    total['bytes'] += stage['bytes']
+    if stage['status'] is not None:
+        total['status'] = stage['status']
+
+
+class TargetMetrics:
+    """Stages and outcome of one target. Only touched by the thread checking it."""
+
+    __slots__ = ('name', 'labels', 'started', 'seconds', 'stages', 'ok', 'error')
+
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        self.name = name
+        self.labels = labels
+        self.started = time.time()
+        self.seconds = 0.0
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.ok = True
+        self.error: Optional[str] = None
+
+    def stage(self, name: str) -> Dict[str, Any]:
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = _new_stage()
+        return stage
+
+    def fail(self, error: Any) -> None:
+        self.ok = False
+        self.error = str(error)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'target': self.name,
+            'labels': self.labels,
+            'time': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'seconds': round(self.seconds, 6),
+            'ok': self.ok,
+            'error': self.error,
+            'stages': self.stages,
+        }
+
+
+class RunMetrics:
+    def __init__(self, run: str, log_path: Optional[str] = None, textfile_dir: Optional[str] = None):
+        """
+        run: name of the run, used as the Prometheus label and textfile name.
+        log_path/textfile_dir default to METRICS_LOG/METRICS_TEXTFILE_DIR. Targets
+        are appended to the log as they finish and not kept, so memory stays flat
+        however many targets a run has; only the run totals are kept.
+        """
+        self.run = run
+        self.run_id = uuid.uuid4().hex[:12]
+        self.log_path = log_path or os.getenv('METRICS_LOG')
+        self.textfile_dir = textfile_dir or os.getenv('METRICS_TEXTFILE_DIR')
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.seconds = 0.0
+        self._log: Optional[TextIO] = None
+        # Run-wide totals, kept up to date as targets finish
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.statuses: Dict[str, int] = {}
+        self.succeeded = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._previous: Optional['RunMetrics'] = None
+
+    # Recording
+
+    def add_target(self, target: TargetMetrics) -> None:
+        with self._lock:
+            if self.log_path:
+                self._write_target(target)
+            if target.ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            for name, stage in target.stages.items():
+                self._add_stage(name, stage)
+
+    def add_stage(self, name: str, stage: Dict[str, Any]) -> None:
+        """Record a stage that didn't belong to a target."""
+        with self._lock:
+            self._add_stage(name, stage)
+
+    def _add_stage(self, name: str, stage: Dict[str, Any]) -> None:
+        _add_stage(self.stages, name, stage)
+        if stage['status'] is not None:
+            key = str(stage['status'])
+            self.statuses[key] = self.statuses.get(key, 0) + stage['count']
+
+    # Lifecycle
+
+    def __enter__(self) -> 'RunMetrics':
+        global _active_run
+        self._previous, _active_run = _active_run, self
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _active_run
+        _active_run = self._previous
+        self.finish()
+
+    @contextmanager
+    def bind(self):
+        """
+        Make this the active run for the current context only, leaving the
+        process-wide run alone; worker threads see it when they are started
+        through contextvars.copy_context().run. Finishes the run on exit.
+        """
+        token = _context_run.set(self)
+        try:
+            yield self
+        finally:
+            _context_run.reset(token)
+            self.finish()
+
+    def finish(self) -> None:
+        """Stop the clock and write the configured outputs."""
+        self.seconds = time.perf_counter() - self._start
+        try:
+            if self.log_path:
+                with self._lock:
+                    log = self._open_log()
+                    log.write(json.dumps(self.summary()) + '\n')
+                    log.close()
+                    self._log = None
+            if self.textfile_dir:
+                self.write_textfile(os.path.join(self.textfile_dir, f"{self.run}.prom"))
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'type': 'run',
+            'run': self.run,
+            'run_id': self.run_id,
+            'time': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'seconds': round(self.seconds, 6),
+            'targets': self.succeeded + self.failed,
+            'failed': self.failed,
+            'statuses': self.statuses,
+            'stages': self.stages,
+        }
+
+    def _open_log(self) -> TextIO:
+        # Opened on the first line; lines of concurrent runs can interleave, run_id tells them apart
+        if self._log is None:
+            self._log = open(self.log_path, 'a', encoding='utf-8')
+        return self._log
+
+    def _write_target(self, target: TargetMetrics) -> None:
+        try:
+            self._open_log().write(json.dumps({'type': 'target', 'run': self.run, 'run_id': self.run_id,
+                                               **target.to_dict()}) + '\n')
+        except OSError as e:
+            # Stop logging for this run rather than failing every target
+            print(f"Error writing metrics: {e}")
+            self.log_path = None
+
+    def write_textfile(self, path: str) -> None:
+        """Write the run totals in the Prometheus text format, atomically for the textfile collector."""
+        run = _label(self.run)
+        lines = [
+            '# HELP monitor_run_duration_seconds Wall time of the last run.',
+            '# TYPE monitor_run_duration_seconds gauge',
+            f'monitor_run_duration_seconds{{run="{run}"}} {self.seconds:.6f}',
+            '# HELP monitor_run_timestamp_seconds When the last run started.',
+            '# TYPE monitor_run_timestamp_seconds gauge',
+            f'monitor_run_timestamp_seconds{{run="{run}"}} {self.started:.3f}',
+            '# HELP monitor_targets Targets checked in the last run by outcome.',
+            '# TYPE monitor_targets gauge',
+            f'monitor_targets{{run="{run}",outcome="ok"}} {self.succeeded}',
+            f'monitor_targets{{run="{run}",outcome="failed"}} {self.failed}',
+            '# HELP monitor_stage_seconds Time spent per stage in the last run.',
+            '# TYPE monitor_stage_seconds gauge',
+        ]
+        for name, stage in sorted(self.stages.items()):
+            lines.append(f'monitor_stage_seconds{{run="{run}",stage="{_label(name)}"}} {stage["seconds"]:.6f}')
+        lines += ['# HELP monitor_stage_calls Stage executions in the last run.',
+                  '# TYPE monitor_stage_calls gauge']
+        for name, stage in sorted(self.stages.items()):
+            lines.append(f'monitor_stage_calls{{run="{run}",stage="{_label(name)}"}} {stage["count"]}')
+        lines += ['# HELP monitor_stage_bytes Bytes transferred per stage in the last run.',
+                  '# TYPE monitor_stage_bytes gauge']
+        for name, stage in sorted(self.stages.items()):
+            lines.append(f'monitor_stage_bytes{{run="{run}",stage="{_label(name)}"}} {stage["bytes"]}')
+        lines += ['# HELP monitor_http_responses HTTP responses in the last run by status.',
+                  '# TYPE monitor_http_responses gauge']
+        for status, count in sorted(self.statuses.items()):
+            lines.append(f'monitor_http_responses{{run="{run}",status="{_label(status)}"}} {count}')
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+def _label(value: str) -> str:
+    return re.sub(r'(["\\])', r'\\\1', str(value)).replace('\n', ' ')
+
+
+def active_run() -> Optional[RunMetrics]:
+    return _context_run.get() or _active_run
+
+
+# Profiling
+
+PROFILE_TARGET = os.getenv('PROFILE_TARGET')
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')
+
+# Only one profiler can be active per process; targets matching while it is held aren't profiled
+_profile_lock = threading.Lock()
+
+
+def _profile_path(name: str) -> str:
+    safe = re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('_')[:100] or 'target'
+    return os.path.join(PROFILE_DIR, f"profile-{safe}-{int(time.time())}.prof")
+
+
+# Recording helpers; all of them do nothing when no run is active
+
+@contextmanager
+def target(name: str, **labels):
+    """
+    Record one target. An exception escaping the block marks it failed and is re-raised.
+    Yields the TargetMetrics, or None when no run is active.
+    """
+    run = active_run()
+    profiler = None
+    if PROFILE_TARGET and fnmatch(name, PROFILE_TARGET) and _profile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+    if run is None and profiler is None:
+        yield None
+        return
+
+    record = TargetMetrics(name, labels)
+    token = _current_target.set(record)
+    start = time.perf_counter()
+    try:
+        if profiler:
+            profiler.enable()
+        yield record
+    except BaseException as e:
+        record.fail(e.__class__.__name__ if not str(e) else f"{e.__class__.__name__}: {e}")
+        raise
+    finally:
+        if profiler:
+            try:
+                profiler.disable()
+                path = _profile_path(name)
+                profiler.dump_stats(path)
+                print(f"Wrote profile for {name} to {path}")
+            finally:
+                _profile_lock.release()
+        record.seconds = time.perf_counter() - start
+        _current_target.reset(token)
+        if run is not None:
+            run.add_target(record)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of the current target (or of the run, outside any target)."""
+    record = _current_target.get()
+    run = active_run()
+    if record is None and run is None:
+        yield
+        return
+
+    stage_record = record.stage(name) if record is not None else _new_stage()
+    token = _current_stage.set(stage_record)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_record['seconds'] += time.perf_counter() - start
+        stage_record['count'] += 1
+        _current_stage.reset(token)
+        if record is None:
+            run.add_stage(name, stage_record)
+
+
+def add_bytes(count: int) -> None:
+    stage_record = _current_stage.get()
+    if stage_record is not None:
+        stage_record['bytes'] += count
+
+
+def record_response(response) -> None:
+    """Record status and body size of a requests response in the current stage."""
+    stage_record = _current_stage.get()
+    if stage_record is not None:
+        stage_record['status'] = response.status_code
+        stage_record['bytes'] += len(response.content or b'')
+
+
+def label(key: str, value: Any) -> None:
+    """Attach a label to the current target."""
+    record = _current_target.get()
+    if record is not None:
+        record.labels[key] = value
+
+
+def fail(error: Any) -> None:
+    """Mark the current target failed without raising."""
+    record = _current_target.get()
+    if record is not None:
+        record.fail(error)
+
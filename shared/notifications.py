@@ -1,50 +1,355 @@
 import requests
 import os
 import json
-from typing import Optional
+import time
+import atexit
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import http_client
+import metrics
+
+# Discord webhook limits
+DISCORD_CONTENT_LIMIT = 2000
+DISCORD_MAX_ATTACHMENTS = 10
+DISCORD_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# Separator between alerts merged into one webhook post
+MESSAGE_SEPARATOR = "\n\n"
+
+
+class Notification:
+    """A queued message; the attachment is read into memory when it is queued."""
+
+    __slots__ = ("message", "webhook_url", "attachment", "future")
+
+    def __init__(self, message: str, webhook_url: str, attachment: Optional[Tuple[str, bytes]] = None):
+        self.message = message
+        self.webhook_url = webhook_url
+        self.attachment = attachment
+        self.future: Future = Future()
+
+
+def _retry_after(response: requests.Response) -> float:
+    """Seconds Discord asks us to wait, from the Retry-After header or the JSON body."""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    try:
+        return float(response.json().get("retry_after", 1.0))
+    except (ValueError, AttributeError):
+        return 1.0
+
+
+class DiscordWebhookClient:
+    """Posts to Discord webhooks, honoring 429 Retry-After and per-webhook rate limit buckets."""
+
+    def __init__(self, max_attempts: int = 5):
+        self.max_attempts = max_attempts
+        self._blocked_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _wait_for_bucket(self, webhook_url: str) -> None:
+        with self._lock:
+            blocked_until = self._blocked_until.get(webhook_url, 0.0)
+        delay = blocked_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _update_bucket(self, webhook_url: str, response: requests.Response) -> None:
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset_after = response.headers.get("X-RateLimit-Reset-After")
+        if remaining == "0" and reset_after:
+            try:
+                with self._lock:
+                    self._blocked_until[webhook_url] = time.monotonic() + float(reset_after)
+            except ValueError:
+                pass
+
+    def post(self, webhook_url: str, content: str,
+             attachments: Optional[List[Tuple[str, bytes]]] = None) -> bool:
+        """Send one webhook message, retrying on rate limits and server errors."""
+        for attempt in range(self.max_attempts):
+            self._wait_for_bucket(webhook_url)
+            try:
+                # Kept out of the scrapers' circuit breaker, so one failing message doesn't drop the rest
+                with metrics.stage('discord_post'):
+                    if attachments:
+                        files = {
+                            f"files[{index}]": (filename, data, 'image/png')
+                            for index, (filename, data) in enumerate(attachments)
+                        }
+                        response = http_client.post(webhook_url, data={"content": content}, files=files,
+                                                    breaker=False)
+                    else:
+                        response = http_client.post(webhook_url, json={"content": content}, breaker=False)
+            except requests.RequestException as e:
+                print(f"Failed to send Discord message: {e}")
+                time.sleep(min(2 ** attempt, 30))
+                continue
+
+            self._update_bucket(webhook_url, response)
+            if response.status_code == 429:
+                delay = _retry_after(response)
+                print(f"Discord rate limited, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if response.status_code >= 500:
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            if response.ok:
+                return True
+
+            print(f"Failed to send message to Discord: {response.status_code}, {response.text}")
+            return False
+
+        print("Giving up on Discord message after repeated failures")
+        return False
+
+
+def _split_content(message: str) -> List[str]:
+    """Split a message longer than Discord's content limit, preferring line breaks."""
+    chunks = []
+    while len(message) > DISCORD_CONTENT_LIMIT:
+        cut = message.rfind("\n", 0, DISCORD_CONTENT_LIMIT)
+        if cut <= 0:
+            cut = DISCORD_CONTENT_LIMIT
+        chunks.append(message[:cut])
+        message = message[cut:].lstrip("\n")
+    chunks.append(message)
+    return chunks
+
+
+def _coalesce(notifications: List[Notification]) -> List[Tuple[str, List[Tuple[str, bytes]], List[Notification]]]:
+    """
+    Merge notifications for one webhook into as few posts as Discord's limits allow.
+    Returns [(content, attachments, notifications_in_post)].
+    """
+    posts = []
+    content = ""
+    attachments: List[Tuple[str, bytes]] = []
+    members: List[Notification] = []
+    upload_bytes = 0
+
+    def emit():
+        nonlocal content, attachments, members, upload_bytes
+        if members:
+            posts.append((content, attachments, members))
+        content, attachments, members, upload_bytes = "", [], [], 0
+
+    for notification in notifications:
+        chunks = _split_content(notification.message)
+        attachment_size = len(notification.attachment[1]) if notification.attachment else 0
+
+        if len(chunks) > 1:
+            # Oversized messages are posted on their own, attachment on the last chunk
+            emit()
+            for chunk in chunks[:-1]:
+                posts.append((chunk, [], [notification]))
+            content = chunks[-1]
+            attachments = [notification.attachment] if notification.attachment else []
+            members = [notification]
+            upload_bytes = attachment_size
+            emit()
+            continue
+
+        merged = content + MESSAGE_SEPARATOR + notification.message if content else notification.message
+        fits = (
+            len(merged) <= DISCORD_CONTENT_LIMIT
+            and (not notification.attachment or (
+                len(attachments) < DISCORD_MAX_ATTACHMENTS
+                and upload_bytes + attachment_size <= DISCORD_MAX_UPLOAD_BYTES
+            ))
+        )
+        if not fits:
+            emit()
+            merged = notification.message
+        content = merged
+        if notification.attachment:
+            attachments.append(notification.attachment)
+            upload_bytes += attachment_size
+        members.append(notification)
+
+    emit()
+    return posts
+
+
+class NotificationDispatcher:
+    """
+    Sends queued notifications from a background thread so the scan is never
+    blocked by Discord. Messages queued within `linger` seconds of each other
+    are merged into as few webhook posts as the content and attachment limits allow.
+    """
+
+    def __init__(self, linger: float = 2.0, client: Optional[DiscordWebhookClient] = None):
+        self.linger = linger
+        self.client = client or DiscordWebhookClient()
+        self._queue: List[Notification] = []
+        self._condition = threading.Condition()
+        self._flush_requested = False
+        self._in_progress = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name="notification-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, message: str, webhook_url: str, file_path: Optional[str] = None) -> Future:
+        """Queue a message; the returned future resolves to True once Discord accepted it."""
+        attachment = None
+        if file_path and os.path.exists(file_path):
+            # Read now: the monitor moves screenshots around before the post goes out
+            with open(file_path, 'rb') as f:
+                attachment = (os.path.basename(file_path), f.read())
+
+        notification = Notification(message, webhook_url, attachment)
+        with self._condition:
+            if self._closed:
+                notification.future.set_result(False)
+                return notification.future
+            self._queue.append(notification)
+            self._condition.notify_all()
+        return notification.future
+
+    def _take_batch(self) -> Optional[List[Notification]]:
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            if not self._queue:
+                return None
+            # Give the rest of the run a moment to queue more alerts
+            deadline = time.monotonic() + self.linger
+            while not self._flush_requested and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch, self._queue = self._queue, []
+            self._in_progress = len(batch)
+            return batch
+
+    def _worker(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+
+            by_webhook: Dict[str, List[Notification]] = {}
+            for notification in batch:
+                by_webhook.setdefault(notification.webhook_url, []).append(notification)
+
+            for webhook_url, notifications in by_webhook.items():
+                results: Dict[int, bool] = {}
+                for content, attachments, members in _coalesce(notifications):
+                    try:
+                        sent = self.client.post(webhook_url, content, attachments)
+                    except Exception as e:
+                        print(f"Error sending Discord message: {e}")
+                        sent = False
+                    for member in members:
+                        results[id(member)] = results.get(id(member), True) and sent
+                for notification in notifications:
+                    notification.future.set_result(results.get(id(notification), False))
+
+            with self._condition:
+                self._in_progress = 0
+                if not self._queue:
+                    self._flush_requested = False
+                self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Send everything queued so far and wait for it; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._queue or self._in_progress:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self._flush_requested = False
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush and stop the background thread."""
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """Return the process-wide dispatcher; it is flushed automatically at exit."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher()
+            atexit.register(_dispatcher.close)
+        return _dispatcher
+
+
+def flush_notifications(timeout: Optional[float] = None) -> bool:
+    """Wait until every queued notification has been sent."""
+    if _dispatcher is None:
+        return True
+    return _dispatcher.flush(timeout)
 
 
 def send_discord_message(message: str, webhook_url: str, file_path: Optional[str] = None) -> bool:
     """Send a message to Discord via webhook with optional file attachment."""
     try:
+        attachments = None
         if file_path and os.path.exists(file_path):
-            # Send message with file attachment
             with open(file_path, 'rb') as f:
-                files = {
-                    'file': (os.path.basename(file_path), f, 'image/png')
-                }
-                data = {
-                    'content': message
-                }
-                response = requests.post(webhook_url, data=data, files=files)
-        else:
-            # Send message without file
-            data = {"content": message}
-            response = requests.post(webhook_url, json=data)
-        
-        response.raise_for_status()
-        return True
-        
-    except requests.RequestException as e:
-        print(f"Failed to send Discord message: {e}")
-        return False
+                attachments = [(os.path.basename(file_path), f.read())]
+        return DiscordWebhookClient().post(webhook_url, message, attachments)
     except Exception as e:
         print(f"Error sending Discord message: {e}")
         return False
 
 
+def _resolve_webhook(webhook_url: Optional[str]) -> Optional[str]:
+    # Get webhook URL from parameter or environment
+    webhook_url = webhook_url or os.getenv("DISCORD_WEBHOOK")
+    if not webhook_url:
+        print("Discord webhook URL not provided. Set DISCORD_WEBHOOK environment variable.")
+    return webhook_url
+
+
 def send_notification(
     message: str,
     webhook_url: Optional[str] = None,
     image_path: Optional[str] = None
 ) -> bool:
     """Send notification via Discord webhook."""
-    
-    # Get webhook URL from parameter or environment
-    webhook_url = webhook_url or os.getenv("DISCORD_WEBHOOK")
-    
+    webhook_url = _resolve_webhook(webhook_url)
     if not webhook_url:
-        print("Discord webhook URL not provided. Set DISCORD_WEBHOOK environment variable.")
         return False
-    
-    return send_discord_message(message, webhook_url, image_path)
\ No newline at end of file
+
+    return send_discord_message(message, webhook_url, image_path)
+
+
+def queue_notification(
+    message: str,
+    webhook_url: Optional[str] = None,
+    image_path: Optional[str] = None
+) -> Future:
+    """
+    Queue a notification for the background dispatcher and return immediately.
+    The future resolves to True once Discord accepted the (possibly merged) post.
+    """
+    webhook_url = _resolve_webhook(webhook_url)
+    if not webhook_url:
+        future: Future = Future()
+        future.set_result(False)
+        return future
+
+    return get_dispatcher().submit(message, webhook_url, image_path)
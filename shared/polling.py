@@ -0,0 +1,136 @@
+"""
+Adaptive polling intervals.
+
+Each target starts at its configured interval. Every check that sees no
+change multiplies the interval by `backoff`, up to `max_interval`; a check
+that sees a change resets it to `min_interval`. Volatile targets therefore
+stay near the minimum while stable ones are polled rarely, and a change is
+still picked up within one interval of the moment polling speeds back up.
+
+The per-target state is kept in a small JSON file so one-shot runs (cron,
+GitHub Actions) can skip targets that aren't due yet.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+# A target counts as due this fraction of its interval early, so a cron run
+# that fires a little before the exact due time doesn't skip a whole cycle
+DUE_TOLERANCE = 0.1
+
+
+class AdaptivePolicy:
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 2.0):
+        """Intervals in seconds."""
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("need 0 < min_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = max(1.0, backoff)
+
+    def clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def next_interval(self, interval: float, changed: bool) -> float:
+        if changed:
+            return self.min_interval
+        return self.clamp(interval * self.backoff)
+
+
+class PollState:
+    """Per-target intervals, last checks and change counts, persisted to JSON."""
+
+    def __init__(self, file_path: str, policy: AdaptivePolicy):
+        self.file_path = file_path
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._targets: Dict[str, Dict[str, Any]] = self._load()
+        self._dirty = set()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.file_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def interval(self, key: Hashable, base: Optional[float] = None) -> float:
+        """Current interval of a target; base (or the minimum) for targets not seen yet."""
+        with self._lock:
+            target = self._targets.get(str(key))
+            if target is not None:
+                return target['interval']
+        return self.policy.clamp(base or self.policy.min_interval)
+
+    def next_due(self, key: Hashable) -> Optional[float]:
+        """When a target is next due; None if it has never been checked."""
+        with self._lock:
+            target = self._targets.get(str(key))
+            if target is None:
+                return None
+            return target['last_check'] + target['interval']
+
+    def is_due(self, key: Hashable, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            target = self._targets.get(str(key))
+            if target is None:
+                return True
+            return now >= target['last_check'] + target['interval'] * (1 - DUE_TOLERANCE)
+
+    def record(self, key: Hashable, changed: bool, base: Optional[float] = None,
+               now: Optional[float] = None) -> float:
+        """Record a check outcome and return the target's new interval."""
+        now = time.time() if now is None else now
+        key = str(key)
+        with self._lock:
+            target = self._targets.get(key)
+            if target is None:
+                target = self._targets[key] = {
+                    'interval': self.policy.clamp(base or self.policy.min_interval),
+                    'checks': 0,
+                    'changes': 0,
+                    'last_change': None,
+                }
+            target['interval'] = self.policy.next_interval(target['interval'], changed)
+            target['last_check'] = now
+            target['checks'] += 1
+            if changed:
+                target['changes'] += 1
+                target['last_change'] = now
+            self._dirty.add(key)
+            return target['interval']
+
+    def retain(self, keys: Iterable[Hashable]) -> None:
+        """Drop the state of targets that are no longer configured."""
+        keep = {str(key) for key in keys}
+        with self._lock:
+            for key in [key for key in self._targets if key not in keep]:
+                del self._targets[key]
+                self._dirty.add(key)
+
+    def save(self) -> None:
+        """
+        Write the targets recorded since the last save. Entries are merged into
+        the file as it is now, so workers sharing the file don't drop each other's updates.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            on_disk = self._load()
+            for key in self._dirty:
+                if key in self._targets:
+                    on_disk[key] = self._targets[key]
+                else:
+                    on_disk.pop(key, None)
+            directory = os.path.dirname(os.path.abspath(self.file_path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.file_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(on_disk, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.file_path)
+            self._targets.update(on_disk)
+            self._dirty.clear()
@@ -0,0 +1,168 @@
+"""
+Retries and per-host circuit breakers for outgoing requests.
+
+A failed request is retried with capped exponential backoff and full jitter,
+or after the server's Retry-After when it sends one, as long as the process
+wide retry budget allows it. The budget keeps retries to a fraction of all
+requests, so an outage doesn't multiply the load on the host or the run time.
+
+Every host has a circuit breaker. After `failure_threshold` consecutive
+failures it opens and requests to the host fail immediately with
+CircuitOpenError for a cool-down period. Once the cool-down has passed one
+request is let through as a probe: success closes the breaker, failure opens
+it again for twice as long (up to `max_cool_down`). A dead retailer therefore
+costs a few timeouts instead of one per product.
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+
+# Statuses worth retrying: rate limits and transient server errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """A request was not sent because its host's circuit breaker is open."""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuit open for {host}, retrying in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 10.0):
+        """
+        max_attempts: tries per request, the first one included.
+        Delays in seconds; a Retry-After longer than max_delay is not waited for.
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number attempt + 1: full jitter over a capped exponential."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date); None without one."""
+    header = response.headers.get("Retry-After")
+    if not header:
+        return None
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10):
+        """
+        Allow retries for up to ratio of requests. The budget starts with, and
+        never holds more than, min_retries, so a quiet process can still retry
+        a few isolated failures.
+        """
+        self.ratio = ratio
+        self.capacity = float(min_retries)
+        self._tokens = float(min_retries)
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        """Record a request."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Take one retry from the budget; False when it is spent."""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class _Circuit:
+    __slots__ = ("failures", "open_until", "cool_down", "probing")
+
+    def __init__(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.cool_down = 0.0
+        self.probing = False
+
+
+class CircuitBreakers:
+    def __init__(self, failure_threshold: int = 5, cool_down: float = 60.0, max_cool_down: float = 600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """Cool-downs in seconds; one breaker per key (host), created on first use."""
+        self.failure_threshold = max(1, failure_threshold)
+        self.cool_down = cool_down
+        self.max_cool_down = max(cool_down, max_cool_down)
+        self._clock = clock
+        self._circuits: Dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def retry_in(self, key: str) -> float:
+        """Seconds left in the key's cool-down; 0 when requests may be sent."""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                return 0.0
+            return max(0.0, circuit.open_until - self._clock())
+
+    def is_open(self, key: str) -> bool:
+        return self.retry_in(key) > 0
+
+    def check(self, key: str) -> None:
+        """Raise CircuitOpenError while the key is cooling down, without claiming a probe."""
+        retry_in = self.retry_in(key)
+        if retry_in > 0:
+            raise CircuitOpenError(key, retry_in)
+
+    def before(self, key: str) -> None:
+        """
+        Call before sending a request; raises CircuitOpenError while the key is open.
+        The first request after a cool-down is the probe: until it reports back, the
+        others keep failing fast for another cool-down.
+        """
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.failures < self.failure_threshold:
+                return
+            now = self._clock()
+            if now < circuit.open_until:
+                raise CircuitOpenError(key, circuit.open_until - now)
+            circuit.open_until = now + circuit.cool_down
+            circuit.probing = True
+
+    def success(self, key: str) -> None:
+        with self._lock:
+            self._circuits.pop(key, None)
+
+    def failure(self, key: str) -> None:
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            circuit.failures += 1
+            if circuit.failures < self.failure_threshold:
+                return
+            # Opens at the threshold and every failed probe doubles the cool-down;
+            # requests that were already in flight when it opened don't count
+            if circuit.probing:
+                circuit.probing = False
+                circuit.cool_down = min(self.max_cool_down, circuit.cool_down * 2)
+            elif not circuit.cool_down:
+                circuit.cool_down = self.cool_down
+                print(f"Circuit opened for {key} after {circuit.failures} failures")
+            else:
+                return
+            circuit.open_until = self._clock() + circuit.cool_down
@@ -0,0 +1,95 @@
+"""
+Priority-queue scheduler for per-target check intervals.
+"""
+
+import heapq
+import itertools
+import random
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class Scheduler:
+    """
+    Keeps every target on its own interval. Due times are jittered so targets
+    that share an interval drift apart instead of all firing at once.
+    """
+
+    def __init__(self, jitter: float = 0.1):
+        """jitter: fraction of the interval added or subtracted at random."""
+        self.jitter = jitter
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._due: Dict[Hashable, float] = {}
+        self._intervals: Dict[Hashable, float] = {}
+        self._counter = itertools.count()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._intervals
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def keys(self):
+        return self._intervals.keys()
+
+    def _jittered(self, interval: float) -> float:
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _push(self, key: Hashable, due: float) -> None:
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, next(self._counter), key))
+
+    def add(self, key: Hashable, interval: float, now: Optional[float] = None,
+            due: Optional[float] = None) -> None:
+        """
+        Add a target. Its first check is at `due` when given (e.g. from a
+        previous process), otherwise spread over the first jitter window.
+        """
+        now = time.time() if now is None else now
+        self._intervals[key] = interval
+        self._push(key, due if due is not None else now + random.uniform(0, interval * self.jitter))
+
+    def set_interval(self, key: Hashable, interval: float) -> None:
+        """Change a target's interval; takes effect when it is next rescheduled."""
+        self._intervals[key] = interval
+
+    def interval(self, key: Hashable) -> float:
+        return self._intervals[key]
+
+    def remove(self, key: Hashable) -> None:
+        """Drop a target; its stale heap entry is skipped lazily."""
+        self._intervals.pop(key, None)
+        self._due.pop(key, None)
+
+    def reschedule(self, key: Hashable, now: Optional[float] = None, interval: Optional[float] = None) -> None:
+        """Schedule the next check of a target that just ran."""
+        if key not in self._intervals:
+            return
+        if interval is not None:
+            self._intervals[key] = interval
+        now = time.time() if now is None else now
+        self._push(key, now + self._jittered(self._intervals[key]))
+
+    def _discard_stale(self) -> None:
+        while self._heap:
+            due, _, key = self._heap[0]
+            if self._due.get(key) == due:
+                return
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[float]:
+        """Time of the earliest pending check, or None when nothing is scheduled."""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[float] = None) -> List[Hashable]:
+        """Remove and return every target due at `now`; call reschedule once each has run."""
+        now = time.time() if now is None else now
+        due_keys = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due_keys
+            _, _, key = heapq.heappop(self._heap)
+            del self._due[key]
+            due_keys.append(key)
@@ -0,0 +1,308 @@
+"""
+Sharded execution across worker processes.
+
+Targets are split into shards by consistent hashing on their host, so each
+retailer's traffic stays on one worker and the per-host limits still hold.
+Workers coordinate through a SQLite lease store:
+
+- a worker claims a shard by taking its lease and renews the lease from a
+  heartbeat thread while it works;
+- a finished shard is marked complete for the run;
+- a shard whose lease expired (its worker crashed or hung) is claimed again
+  by whichever worker gets to it first;
+- every alert is claimed in the store before it is sent, so a shard that is
+  re-run after a takeover doesn't alert twice.
+
+The store is a local SQLite file; workers on several machines need it on a
+shared filesystem that supports SQLite locking.
+"""
+
+import argparse
+import bisect
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from fetch_engine import host_of
+
+T = TypeVar('T')
+
+# Points per shard on the hash ring; more points spread hosts more evenly
+VIRTUAL_NODES = 64
+
+DEFAULT_LEASE_SECONDS = 300
+
+# Finished runs and sent-alert records are kept this long
+RETENTION_SECONDS = 7 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shard_leases (
+    run_id TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    owner TEXT,
+    expires_at REAL,
+    completed_at REAL,
+    PRIMARY KEY (run_id, shard)
+);
+CREATE TABLE IF NOT EXISTS sent_alerts (
+    alert_key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    sent_at REAL NOT NULL
+);
+"""
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class ShardRing:
+    """Consistent hash ring mapping keys (hosts) to shard numbers 0..shard_count-1."""
+
+    def __init__(self, shard_count: int, virtual_nodes: int = VIRTUAL_NODES):
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+        self.shard_count = shard_count
+        points = sorted((_hash(f"shard-{shard}-{node}"), shard)
+                        for shard in range(shard_count) for node in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_of(self, key: str) -> int:
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._shards[index]
+
+    def shard_of_url(self, url: str) -> int:
+        return self.shard_of(host_of(url))
+
+    def split(self, items: Iterable[T], url_of: Callable[[T], str]) -> Dict[int, List[T]]:
+        """Group items by shard."""
+        shards: Dict[int, List[T]] = {}
+        for item in items:
+            shards.setdefault(self.shard_of_url(url_of(item)), []).append(item)
+        return shards
+
+
+class LeaseStore:
+    """SQLite-backed shard leases and sent-alert records. Safe to use from several threads and processes."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Short-lived connections: leases change rarely and each thread gets its own
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, run_id: str, shard: int, owner: str, lease_seconds: float) -> bool:
+        """Take the lease on a shard that is unclaimed, expired or already ours and not complete."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT owner, expires_at, completed_at FROM shard_leases WHERE run_id = ? AND shard = ?",
+                (run_id, shard),
+            ).fetchone()
+            if row is not None:
+                current_owner, expires_at, completed_at = row
+                if completed_at is not None:
+                    return False
+                if current_owner != owner and expires_at is not None and expires_at > now:
+                    return False
+            conn.execute(
+                "INSERT OR REPLACE INTO shard_leases (run_id, shard, owner, expires_at, completed_at) "
+                "VALUES (?, ?, ?, ?, NULL)",
+                (run_id, shard, owner, now + lease_seconds),
+            )
+            if row is not None and row[0] not in (None, owner):
+                print(f"Took over shard {shard} from {row[0]} (lease expired)")
+            return True
+
+    def renew(self, run_id: str, shards: Iterable[int], owner: str, lease_seconds: float) -> List[int]:
+        """Extend our leases; returns the shards whose lease we no longer hold."""
+        lost = []
+        with self._transaction() as conn:
+            for shard in shards:
+                cursor = conn.execute(
+                    "UPDATE shard_leases SET expires_at = ? "
+                    "WHERE run_id = ? AND shard = ? AND owner = ? AND completed_at IS NULL",
+                    (time.time() + lease_seconds, run_id, shard, owner),
+                )
+                if cursor.rowcount == 0:
+                    lost.append(shard)
+        return lost
+
+    def complete(self, run_id: str, shard: int, owner: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE shard_leases SET completed_at = ?, expires_at = NULL WHERE run_id = ? AND shard = ? AND owner = ?",
+                (time.time(), run_id, shard, owner),
+            )
+
+    def status(self, run_id: str, shard_count: int) -> Tuple[List[int], List[int]]:
+        """Return (claimable, running) shards of a run; the rest are complete."""
+        now = time.time()
+        with self._connect() as conn:
+            rows = dict(
+                (shard, (expires_at, completed_at)) for shard, expires_at, completed_at in conn.execute(
+                    "SELECT shard, expires_at, completed_at FROM shard_leases WHERE run_id = ?", (run_id,)
+                )
+            )
+        claimable, running = [], []
+        for shard in range(shard_count):
+            expires_at, completed_at = rows.get(shard, (None, None))
+            if completed_at is not None:
+                continue
+            if expires_at is not None and expires_at > now:
+                running.append(shard)
+            else:
+                claimable.append(shard)
+        return claimable, running
+
+    def claim_alert(self, alert_key: str, owner: str) -> bool:
+        """Record an alert as sent; False if some worker already sent it."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO sent_alerts (alert_key, owner, sent_at) VALUES (?, ?, ?)",
+                (alert_key, owner, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def prune(self, older_than: float) -> None:
+        """Drop completed runs and alert records older than the given timestamp."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM shard_leases WHERE completed_at IS NOT NULL AND completed_at < ?", (older_than,))
+            conn.execute("DELETE FROM sent_alerts WHERE sent_at < ?", (older_than,))
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def default_run_id() -> str:
+    """Workers started for the same scheduled run share a run id: the current UTC hour."""
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H')
+
+
+class ShardWorker:
+    """One worker's view of a sharded run: claims shards, keeps their leases alive and marks them done."""
+
+    def __init__(self, store: LeaseStore, shard_count: int, worker_id: Optional[str] = None,
+                 run_id: Optional[str] = None, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.store = store
+        self.ring = ShardRing(shard_count)
+        self.shard_count = shard_count
+        self.worker_id = worker_id or default_worker_id()
+        self.run_id = run_id or default_run_id()
+        self.lease_seconds = lease_seconds
+        self._held: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                held = list(self._held)
+            if not held:
+                continue
+            try:
+                lost = self.store.renew(self.run_id, held, self.worker_id, self.lease_seconds)
+            except sqlite3.Error as e:
+                print(f"Error renewing shard leases: {e}")
+                continue
+            for shard in lost:
+                print(f"Lost the lease on shard {shard}; another worker may re-run it")
+
+    def shards(self) -> Iterator[int]:
+        """
+        Yield shards to work on until every shard of the run is complete.
+        Each yielded shard is leased to this worker and marked complete when the
+        caller asks for the next one. When nothing is claimable but other workers
+        still hold leases, this waits so it can take over if one of them dies.
+        """
+        self.store.prune(time.time() - RETENTION_SECONDS)
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat.start()
+        # Start at a worker-specific offset so workers don't all race for shard 0
+        offset = int(self.ring.shard_of(self.worker_id))
+        poll = min(5.0, self.lease_seconds / 4)
+        try:
+            while True:
+                claimable, running = self.store.status(self.run_id, self.shard_count)
+                claimable.sort(key=lambda shard: (shard - offset) % self.shard_count)
+                shard = next((shard for shard in claimable
+                              if self.store.claim(self.run_id, shard, self.worker_id, self.lease_seconds)), None)
+                if shard is None:
+                    if not running:
+                        return
+                    time.sleep(poll)
+                    continue
+
+                with self._lock:
+                    self._held[shard] = time.time()
+                try:
+                    yield shard
+                finally:
+                    with self._lock:
+                        self._held.pop(shard, None)
+                self.store.complete(self.run_id, shard, self.worker_id)
+        finally:
+            self._stop.set()
+
+    def alert_once(self, alert_key: str) -> bool:
+        """True if this worker should send the alert; False if it was already sent in this run."""
+        try:
+            return self.store.claim_alert(f"{self.run_id}:{alert_key}", self.worker_id)
+        except sqlite3.Error as e:
+            # Better a possible duplicate than a lost alert
+            print(f"Error recording alert: {e}")
+            return True
+
+
+def add_shard_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group('sharding')
+    group.add_argument('--shard-count', type=int, default=int(os.getenv('SHARD_COUNT', '0')),
+                       help="Split targets into this many shards by host (0 runs everything in this process)")
+    group.add_argument('--worker-id', default=os.getenv('WORKER_ID'),
+                       help="Name of this worker in the lease store (default: hostname:pid)")
+    group.add_argument('--run-id', default=os.getenv('SHARD_RUN_ID'),
+                       help="Run shared by the cooperating workers (default: current UTC hour)")
+    group.add_argument('--state-db', default=os.getenv('SHARD_STATE_DB'),
+                       help="SQLite lease store shared by the workers")
+    group.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS,
+                       help="How long a shard stays leased without a heartbeat")
+
+
+def worker_from_args(args: argparse.Namespace, default_state_db: str) -> Optional[ShardWorker]:
+    """Build the ShardWorker described by add_shard_arguments flags, or None when sharding is off."""
+    if not args.shard_count:
+        return None
+    store = LeaseStore(args.state_db or default_state_db)
+    return ShardWorker(store, args.shard_count, worker_id=args.worker_id, run_id=args.run_id,
+                       lease_seconds=args.lease_seconds)
@@ -4,23 +4,37 @@ import os
 from typing import Any, Optional
 
 
-def clean_number(price_str: str) -> str:
-    """Clean and extract numbers from price strings."""
-    if price_str is None:
-        return "0"
-    
-    # Remove any non-digit characters except decimal points
-    cleaned = re.sub(r'[^\d.,]', '', str(price_str))
-    
-    # Handle European format (comma as decimal separator)
-    if ',' in cleaned and '.' in cleaned:
-        # Assume comma is thousands separator if both present
-        cleaned = cleaned.replace(',', '')
-    elif ',' in cleaned:
-        # Assume comma is decimal separator if only comma present
-        cleaned = cleaned.replace(',', '.')
-    
-    return cleaned
+def parse_price(value: Any) -> Optional[float]:
+    """
+    Parse a price into a number of kroner, or None if it has no digits.
+    Numbers are taken as they are. Strings may carry currency text and use
+    space, '.' or ',' as thousands separator and '.' or ',' as decimal mark:
+    "1 099,00 kr", "999,-", "1.299,50", "1,299.50" and "6090.0" all parse as
+    expected. A single separator followed by exactly three digits ("1.299")
+    is read as a thousands separator.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if value != value else float(value)  # NaN
+
+    # Keep digits and separators; "999,-" and "999.-" mean whole kroner
+    cleaned = re.sub(r'[^\d.,]', '', re.sub(r'[.,]-', '', str(value)))
+    cleaned = cleaned.strip('.,')
+    if not cleaned:
+        return None
+
+    separators = [char for char in cleaned if char in '.,']
+    if separators:
+        last = cleaned.rfind(separators[-1])
+        decimals = len(cleaned) - last - 1
+        if len(set(separators)) == 1 and (len(separators) > 1 or decimals == 3):
+            # Only thousands separators
+            cleaned = cleaned.replace(separators[-1], '')
+        else:
+            # The last separator is the decimal mark
+            cleaned = cleaned[:last].replace('.', '').replace(',', '') + '.' + cleaned[last + 1:]
+    return float(cleaned)
 
 
 def calculate_hash(content: str) -> str: